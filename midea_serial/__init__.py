@@ -1,6 +1,13 @@
 '''
 This decoder stacks on top of the 'uart' PD and decodes Midea Serial Protocol
 
+The frame decoding engine in midea_serial.engine doesn't need libsigrokdecode,
+the PD is only exported when loaded by it.
 '''
 
-from .pd import Decoder
+try:
+    import sigrokdecode
+except ImportError:
+    pass
+else:
+    from .pd import Decoder
@@ -0,0 +1,225 @@
+##
+## Copyright (C) 2020 David Lobato <dav.lobato@gmail.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Air conditioner (appliance type 0xAC) message bodies, loaded by
+FrameDecoder on the first 0xAC frame.
+'''
+
+import functools
+from .engine import TX, ANN_CMD, ANN_ERROR, MSG_BODY_OFFSET, MIN_FRAME_LENGTH
+from .fields import Field, FieldSpec
+from .util import crc8, crc8_854_table
+
+# decode_ac_control() LRU cache size
+AC_CACHE_SIZE = 1024
+
+ac_mode_str = {
+    1: 'auto',
+    2: 'cool',
+    3: 'dry',
+    4: 'heat',
+    5: 'fan only',
+}
+
+ac_fan_speed_str = {
+    20: 'silent',
+    40: 'low',
+    60: 'medium',
+    80: 'high',
+    102: 'auto',
+}
+
+
+def _setpoint(raw):
+    return (raw & 0x0F) + 16 + (0.5 if raw & 0x10 else 0)
+
+
+def _temperature(raw):
+    return (raw - 50) / 2
+
+
+# fields shared by the control command and its response, offsets in the body
+# bytes following the msg type
+_mode_fields = (
+    Field('mode', 2, mask=0xE0, shift=5, enum=ac_mode_str, label='mode'),
+    Field('setpoint', 2, mask=0x1F, convert=_setpoint, label='setpoint', fmt='{:.2f}'),
+    Field('fan_speed', 3, enum=ac_fan_speed_str, label='fanspeed', unknown_fmt='{}'),
+    Field('on_timer', 4, mask=0x80, kind=bool, text=('', 'onTimer')),
+    Field('on_timer_hours', 4, mask=0x7C, shift=2),
+    Field('on_timer_quarters', 4, mask=0x03),
+    Field('off_timer', 5, mask=0x80, kind=bool, text=('', 'offTimer')),
+    Field('off_timer_hours', 5, mask=0x7C, shift=2),
+    Field('off_timer_quarters', 5, mask=0x03),
+    Field('on_timer_minutes', 6, mask=0xF0, shift=4),
+    Field('off_timer_minutes', 6, mask=0x0F),
+    Field('horizontal_swing', 7, mask=0xC0, kind=bool, label='horizontal swing'),
+    Field('vertical_swing', 7, mask=0x03, kind=bool, label='vertical swing'),
+)
+
+
+def _swing_text(raw):
+    return 'horizontal {},vertical {}'.format('on' if raw & 0xC0 else 'off', 'on' if raw & 0x03 else 'off')
+
+
+# both swings annotated together, as 'swing=horizontal on,vertical off'
+_swing = Field('swing', 7, mask=0xC3, convert=_swing_text, label='swing')
+
+AC_CONTROL = FieldSpec('ACControl', (
+    Field('key_status', 1, mask=0x40, kind=bool, text=('', 'keyStatus')),
+    Field('fast_check', 1, mask=0x20, kind=bool, text=('', 'fastCheckActive')),
+    Field('timer_mode', 1, mask=0x10, kind=bool, text=('', 'timerMode')),
+    Field('child_sleep_mode', 1, mask=0x08, kind=bool, text=('', 'childSleepMode')),
+    Field('resume', 1, mask=0x04, kind=bool, text=('', 'resume')),
+    Field('remote_control_mode', 1, mask=0x02, kind=bool, text=('', 'remoteControlMode')),
+    Field('power', 1, mask=0x01, kind=bool),
+) + _mode_fields + (
+    Field('turbo_fan', 8, mask=0x20, kind=bool, text=('', 'turboFan')),
+    Field('eco', 9, mask=0x80, kind=bool, text=('', 'eco')),
+    Field('sleep', 10, mask=0x01, kind=bool, text=('', 'sleep')),
+    Field('turbo', 10, mask=0x02, kind=bool, text=('', 'turbo')),
+    Field('fahrenheit', 10, mask=0x04, kind=bool, text=('', 'fahrenheit')),
+    Field('sleep_curve_1', 11),
+    Field('sleep_curve_2', 12),
+    Field('sleep_curve_3', 13),
+    Field('sleep_curve_4', 14),
+    Field('sleep_curve_5', 15),
+    Field('temperature_unit_phase', 16),
+), annotate=('key_status', 'fast_check', 'timer_mode', 'child_sleep_mode', 'resume', 'remote_control_mode', 'on_timer',
+             'off_timer', 'turbo_fan', 'eco', 'sleep', 'turbo', 'fahrenheit', 'power', 'mode', 'setpoint', 'fan_speed',
+             _swing), module=__name__)
+ACControl = AC_CONTROL.record
+
+AC_STATUS = FieldSpec('ACStatus', (
+    Field('error', 1, mask=0x80, kind=bool, text=('', 'error')),
+    Field('fast_check', 1, mask=0x20, kind=bool, text=('', 'fastCheckActive')),
+    Field('timer_mode', 1, mask=0x10, kind=bool, text=('', 'timerMode')),
+    Field('resume', 1, mask=0x04, kind=bool, text=('', 'resume')),
+    Field('power', 1, mask=0x01, kind=bool),
+) + _mode_fields + (
+    Field('cozy_sleep', 8, mask=0x03),
+    Field('power_saving', 8, mask=0x08, kind=bool, text=('', 'powerSaving')),
+    Field('low_frequency_fan', 8, mask=0x10, kind=bool, text=('', 'lowFrequencyFan')),
+    Field('turbo_fan', 8, mask=0x20, kind=bool, text=('', 'turboFan')),
+    Field('feel_own', 8, mask=0x80, kind=bool, text=('', 'feelOwn')),
+    Field('child_sleep', 9, mask=0x01, kind=bool, text=('', 'childSleep')),
+    Field('natural_fan', 9, mask=0x02, kind=bool, text=('', 'naturalFan')),
+    Field('dry_clean', 9, mask=0x04, kind=bool, text=('', 'dryClean')),
+    Field('ptc_assist', 9, mask=0x08, kind=bool, text=('', 'ptcAssist')),
+    Field('eco', 9, mask=0x10, kind=bool, text=('', 'eco')),
+    Field('clean_up', 9, mask=0x20, kind=bool, text=('', 'cleanUp')),
+    Field('self_feel', 9, mask=0x80, kind=bool, text=('', 'selfFeel')),
+    Field('sleep', 10, mask=0x01, kind=bool, text=('', 'sleep')),
+    Field('turbo', 10, mask=0x02, kind=bool, text=('', 'turbo')),
+    Field('fahrenheit', 10, mask=0x04, kind=bool, text=('', 'fahrenheit')),
+    Field('exchange_air', 10, mask=0x08, kind=bool, text=('', 'exchangeAir')),
+    Field('night_light', 10, mask=0x10, kind=bool, text=('', 'nightLight')),
+    Field('catch_cold', 10, mask=0x20, kind=bool, text=('', 'catchCold')),
+    Field('peak_electricity', 10, mask=0x40, kind=bool, text=('', 'peakElectricity')),
+    Field('cool_fan', 10, mask=0x80, kind=bool, text=('', 'coolFan')),
+    Field('indoor_temperature', 11, convert=_temperature, label='indoor T'),
+    Field('outdoor_temperature', 12, convert=_temperature, label='outdoor T'),
+    Field('humidity', 13, mask=0x7F),
+    Field('indoor_temperature_decimal', 15, mask=0x0F, scale=0.1),
+    Field('outdoor_temperature_decimal', 15, mask=0xF0, shift=4, scale=0.1),
+    Field('error_code', 16, label='error code'),
+), annotate=('error', 'fast_check', 'timer_mode', 'resume', 'on_timer', 'off_timer', 'power_saving',
+             'low_frequency_fan', 'turbo_fan', 'feel_own', 'child_sleep', 'natural_fan', 'dry_clean', 'ptc_assist',
+             'eco', 'clean_up', 'self_feel', 'sleep', 'turbo', 'fahrenheit', 'exchange_air', 'night_light',
+             'catch_cold', 'peak_electricity', 'cool_fan', 'power', 'mode', 'setpoint', 'fan_speed',
+             _swing, 'indoor_temperature', 'outdoor_temperature', 'error_code'),
+    module=__name__)
+ACStatus = AC_STATUS.record
+
+
+@functools.lru_cache(maxsize=AC_CACHE_SIZE)
+def _decode_ac_control(request, msg_body):
+    # msg_body without the msg id and CRC8 bytes, which change on every poll
+    # while the rest of the body usually doesn't. Returns the CRC8 of msg_body,
+    # the annotation text templates ('{}' replaced by the msg id) and the
+    # parsed state.
+    if request:
+        if msg_body and msg_body[0] & 0x40 and len(msg_body) == 23:
+            state = AC_CONTROL.parse(msg_body)
+            description = AC_CONTROL.describe(msg_body).replace('{', '{{').replace('}', '}}')
+            texts = ['Control command[{}]: ' + description, '0x02[{}]>']
+        else:
+            state = None
+            texts = ['Unknown control command[{}]', '<0x02[{}]']
+    else:
+        if msg_body and msg_body[0] & 0xC0 and len(msg_body) == 23:
+            state = AC_STATUS.parse(msg_body)
+            description = AC_STATUS.describe(msg_body).replace('{', '{{').replace('}', '}}')
+            texts = ['Response[{}]: ' + description, '<0x02[{}]']
+        else:
+            state = None
+            texts = ['Unknown response for AC control command', '<0x02[{}]']
+
+    return crc8(msg_body), texts, state
+
+
+def decode_ac_control(request, body):
+    '''
+    Decode the body (msg id and CRC8 included) of a 0x02/0xAC control
+    command, or of its response when request is False. Returns (error, texts,
+    state): the annotation texts, whether they are an error indication and
+    the parsed AC_CONTROL or AC_STATUS record (None if the body couldn't be
+    parsed).
+
+    Appliances repeat the same status over and over, so the decoding is kept
+    in an LRU cache keyed on the body without the msg id and CRC8, see
+    decode_ac_control.cache_info() for hits and misses. The CRC8 is resumed
+    from the cached one so validating a repeated body is a table lookup.
+    '''
+    msg_id = body[-2]
+    crc, texts, state = _decode_ac_control(request, body[:-2])
+    if crc8_854_table[crc ^ msg_id] != body[-1]:
+        return True, ['CRC8 failed'], None
+    return False, [texts[0].format(msg_id), texts[1].format(msg_id)], state
+
+
+decode_ac_control.cache_info = _decode_ac_control.cache_info
+decode_ac_control.cache_clear = _decode_ac_control.cache_clear
+
+
+def cmd_handler_control(decoder, spec, ss, es, data):
+    rxtx, read_data = data
+
+    body = read_data[MSG_BODY_OFFSET:]
+
+    if decoder.debug:
+        print('BODY[{}]: L={} D={}'.format(rxtx, len(body) - 1, body[:-1].hex().upper()))
+
+    error, texts, decoder.frame.state = decode_ac_control(rxtx == spec.direction, body.tobytes())
+    decoder.put(ss, es, ANN_ERROR if error else ANN_CMD + rxtx, texts)
+
+
+def cmd_handler_query(decoder, spec, ss, es, data):
+    rxtx, read_data = data
+
+    msg_body = read_data[MSG_BODY_OFFSET:]
+
+    if crc8(msg_body) == 0:
+        decoder.cmd_handler_generic(spec, ss, es, data)
+    else:
+        decoder.put(ss, es, ANN_ERROR, ['CRC8 failed'])
+
+
+def register(cls):
+    cls.register(0x02, 0xAC, cmd_handler_control, direction=TX, name='AC Device control command',
+                 min_length=MIN_FRAME_LENGTH + 2)
+    cls.register(0x03, 0xAC, cmd_handler_query, direction=TX, name='AC query command')
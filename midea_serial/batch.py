@@ -0,0 +1,216 @@
+##
+## Copyright (C) 2020 David Lobato <dav.lobato@gmail.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Batch decoding of capture files in worker processes.
+
+    python -m midea_serial.batch captures/ 'field/*.sr' --rx D0 --tx D1 --json report.json
+
+Session files (.sr) are decoded from their logic samples with
+midea_serial.uart (requires NumPy), any other file is taken as a raw dump of
+UART bytes received in --direction. Directories are searched for .sr and
+.bin files (see --extension). Files are streamed, so memory use
+doesn't grow with their size, and only the counters of each file travel
+back from the workers.
+'''
+
+import argparse
+import concurrent.futures
+import glob
+import json
+import os
+import sys
+import time
+import zipfile
+from .engine import FrameDecoder, RX, EVENT_FRAME, rxtx_channels
+from .stats import DecoderStats
+
+# raw dumps are read in blocks of this many bytes
+READ_SIZE = 1 << 20
+
+# files taken from directories, the index and checkpoint files kept next to
+# the captures are left out
+CAPTURE_EXTENSIONS = ('.sr', '.bin')
+
+
+def expand(patterns, extensions=CAPTURE_EXTENSIONS):
+    '''
+    Capture files from a list of files, directories and glob patterns, the
+    biggest first so they don't end up alone at the end of the batch. Only
+    the files with one of extensions are taken from directories.
+    '''
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in os.listdir(pattern)
+                       if os.path.splitext(name)[1].lower() in extensions]
+        else:
+            matches = glob.glob(pattern)
+        paths.extend(path for path in matches if os.path.isfile(path))
+    return sorted(set(paths), key=lambda path: (-os.path.getsize(path), path))
+
+
+def feed_capture(engine, path, rx='0', tx='1', baudrate=9600, direction=RX):
+    '''
+    Feed a capture file to engine: the logic samples of a session file
+    decoded with midea_serial.uart, or the bytes of a raw dump received in
+    direction.
+    '''
+    feed = engine.feed
+    if zipfile.is_zipfile(path):
+        from .uart import SrCapture, UartFrontEnd
+        capture = SrCapture(path)
+        uart = UartFrontEnd(capture.samplerate, baudrate, capture.channel(rx), capture.channel(tx))
+        for ss, es, (_, rxtx, (byte, _)) in uart.decode(capture.chunks()):
+            feed(rxtx, ss, es, byte)
+    else:
+        with open(path, 'rb') as f:
+            offset = 0
+            for block in iter(lambda: f.read(READ_SIZE), b''):
+                for ss, byte in enumerate(block, offset):
+                    feed(direction, ss, ss, byte)
+                offset += len(block)
+
+
+def decode_file(path, rx='0', tx='1', baudrate=9600, direction=RX):
+    '''
+    Decode one capture, returns its counters as a JSON serializable dict.
+    '''
+    engine = FrameDecoder()
+    stats = DecoderStats()
+    stats.attach(engine)
+    error_codes = {}
+
+    def on_event(event, rxtx):
+        if event == EVENT_FRAME:
+            error_code = getattr(engine.frame.state, 'error_code', 0)
+            if error_code:
+                error_codes[error_code] = error_codes.get(error_code, 0) + 1
+
+    engine.on_event = on_event
+    start = time.perf_counter()
+    feed_capture(engine, path, rx, tx, baudrate, direction)
+    seconds = time.perf_counter() - start
+
+    result = stats.as_dict()
+    del result['handlers']
+    result['bytes_total'] = sum(sum(states.values()) for states in result['bytes'].values())
+    result['frames_total'] = sum(sum(frames.values()) for frames in result['frames'].values())
+    result['error_codes'] = {str(code): count for code, count in sorted(error_codes.items())}
+    result['seconds'] = seconds
+    result['path'] = path
+    return result
+
+
+def _decode_file(path, kwargs):
+    try:
+        return decode_file(path, **kwargs)
+    except Exception as e:
+        return {'path': path, 'error': '{}: {}'.format(type(e).__name__, e)}
+
+
+def decode_files(paths, workers=None, **kwargs):
+    '''
+    Decode paths in worker processes, yielding the decode_file() results as
+    files finish. Failed files give {'path': path, 'error': message}.
+    '''
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(_decode_file, path, kwargs) for path in paths]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+
+def report(results):
+    '''
+    Consolidated report of decode_file() results.
+    '''
+    frames = {channel: {} for channel in rxtx_channels}
+    error_codes = {}
+    totals = dict(files=0, failed=0, bytes=0, frames=0, checksum_failures=0, crc_failures=0, seconds=0.0)
+    for result in results:
+        totals['files'] += 1
+        if 'error' in result:
+            totals['failed'] += 1
+            continue
+        totals['bytes'] += result['bytes_total']
+        totals['frames'] += result['frames_total']
+        totals['checksum_failures'] += result['checksum_failures']
+        totals['crc_failures'] += result['crc_failures']
+        totals['seconds'] += result['seconds']
+        for channel, counts in result['frames'].items():
+            for msg_type, count in counts.items():
+                frames[channel][msg_type] = frames[channel].get(msg_type, 0) + count
+        for code, count in result['error_codes'].items():
+            error_codes[code] = error_codes.get(code, 0) + count
+
+    totals['checksum_failure_rate'] = totals['checksum_failures'] / totals['frames'] if totals['frames'] else 0.0
+    totals['crc_failure_rate'] = totals['crc_failures'] / totals['frames'] if totals['frames'] else 0.0
+    totals['frames_per_type'] = {channel: dict(sorted(counts.items())) for channel, counts in frames.items()}
+    totals['error_codes'] = error_codes
+    return totals
+
+
+def format_result(result):
+    if 'error' in result:
+        return '{path}: {error}'.format(**result)
+    return '{}: {} frames, {} checksum failures, {} CRC8 failures, error codes {}, {:.0f} bytes/s'.format(
+        result['path'], result['frames_total'], result['checksum_failures'], result['crc_failures'],
+        ', '.join(result['error_codes']) or 'none',
+        result['bytes_total'] / result['seconds'] if result['seconds'] else 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('captures', nargs='+', help='capture files, directories or glob patterns')
+    parser.add_argument('--workers', type=int, help='worker processes (default one per CPU)')
+    parser.add_argument('--rx', default='0', help='RX channel name or bit number of session files')
+    parser.add_argument('--tx', default='1', help='TX channel name or bit number of session files')
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--direction', choices=rxtx_channels, default='RX', help='direction of raw dumps')
+    parser.add_argument('--json', help='write the per file results and the report to this file')
+    parser.add_argument('--extension', action='append', metavar='.EXT',
+                        help='extension of the captures in directories, can be repeated (default {})'.format(
+                            ' '.join(CAPTURE_EXTENSIONS)))
+    args = parser.parse_args(argv)
+
+    paths = expand(args.captures, tuple(ext.lower() for ext in args.extension or CAPTURE_EXTENSIONS))
+    if not paths:
+        parser.error('no capture files found')
+
+    results = []
+    kwargs = dict(rx=args.rx, tx=args.tx, baudrate=args.baudrate, direction=rxtx_channels.index(args.direction))
+    for result in decode_files(paths, args.workers, **kwargs):
+        print(format_result(result))
+        sys.stdout.flush()
+        results.append(result)
+
+    totals = report(results)
+    print('{files} files ({failed} failed), {frames} frames, checksum failure rate {checksum_failure_rate:.4%}, '
+          'CRC8 failure rate {crc_failure_rate:.4%}'.format(**totals))
+    for channel, counts in totals['frames_per_type'].items():
+        print('{}: {}'.format(channel, ', '.join('{} {}'.format(msg_type, count) for msg_type, count in counts.items())))
+    if totals['error_codes']:
+        print('error codes: {}'.format(', '.join('{} ({})'.format(code, count)
+                                                 for code, count in sorted(totals['error_codes'].items()))))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'files': sorted(results, key=lambda result: result['path']), 'report': totals}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+##
+## Copyright (C) 2020 David Lobato <dav.lobato@gmail.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Decoder throughput benchmark on synthetic traffic.
+
+    python -m midea_serial.bench --exchanges 20000 --corrupt-rate 0.01
+
+When libsigrokdecode isn't available the PD runs on top of a stub
+sigrokdecode module that drops everything it is given.
+'''
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+import types
+from .encoder import generate_traffic
+from .engine import FrameDecoder
+from .stats import DecoderStats
+
+
+def stub_sigrokdecode():
+    srd = types.ModuleType('sigrokdecode')
+    srd.OUTPUT_ANN, srd.OUTPUT_PYTHON, srd.OUTPUT_BINARY, srd.OUTPUT_META = range(4)
+    srd.SRD_CONF_SAMPLERATE = 10000
+
+    class Decoder:
+        def register(self, output_type, **kwargs):
+            return output_type
+
+        def put(self, ss, es, output_id, data):
+            pass
+
+    srd.Decoder = Decoder
+    return srd
+
+
+def load_pd():
+    try:
+        import sigrokdecode
+    except ImportError:
+        sys.modules['sigrokdecode'] = stub_sigrokdecode()
+    from .pd import Decoder
+    return Decoder
+
+
+def run_pd(stream, stats=None):
+    Decoder = load_pd()
+    decoder = Decoder()
+    decoder.options = {option['id']: option['default'] for option in Decoder.options}
+    decoder.start()
+    if stats is not None:
+        stats.attach(decoder.engine)
+    decode = decoder.decode
+    for ss, rxtx, byte in stream:
+        decode(ss, ss + 1, ('DATA', rxtx, (byte, [])))
+    return decoder.engine
+
+
+def run_engine(stream, stats=None):
+    engine = FrameDecoder()
+    if stats is not None:
+        stats.attach(engine)
+    feed = engine.feed
+    for ss, rxtx, byte in stream:
+        feed(rxtx, ss, ss + 1, byte)
+    return engine
+
+
+# decode paths to compare, name -> function(stream, stats=None) returning the
+# FrameDecoder used, with stats attached to it
+PATHS = {
+    'pd': run_pd,
+    'engine': run_engine,
+}
+
+
+def build_stream(exchanges, seed, corrupt_rate):
+    stream = []
+    frames = 0
+    for rxtx, frame in generate_traffic(exchanges, seed, corrupt_rate):
+        frames += 1
+        for byte in frame:
+            stream.append((len(stream), rxtx, byte))
+    return stream, frames
+
+
+def bench(path, stream, frames, repeat):
+    run = PATHS[path]
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(stream)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    run(stream)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = DecoderStats()
+    run(stream, stats)
+    stats = stats.as_dict()
+
+    return {
+        'path': path,
+        'seconds': best,
+        'frames_per_second': frames / best,
+        'bytes_per_second': len(stream) / best,
+        'memory_peak': peak,
+        'memory_retained': retained,
+        'handlers': stats.pop('handlers'),
+        'stats': stats,
+    }
+
+
+def print_result(result):
+    print('{path}: {seconds:.3f}s, {frames_per_second:.0f} frames/s, {bytes_per_second:.0f} bytes/s, '
+          'peak memory {memory_peak} B, retained {memory_retained} B'.format(**result))
+    print('    {checksum_failures} checksum failures, {crc_failures} CRC8 failures, {responses_not_expected} responses '
+          'not expected, {resyncs} resyncs, {dropped_bytes} dropped bytes'.format(**result['stats']))
+    for name, stats in sorted(result['handlers'].items(), key=lambda item: -item[1]['time']):
+        print('    {:<70} {:>8} calls {:>10.3f} ms {:>8.2f} us/call {:>8.1f} us peak'.format(
+            name, stats['calls'], stats['time'] * 1e3, stats['time'] * 1e6 / stats['calls'], stats['peak'] * 1e6))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--exchanges', type=int, default=10000, help='request/response exchanges to generate')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--corrupt-rate', type=float, default=0.0, help='probability of a frame being corrupted')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs, the best one is reported')
+    parser.add_argument('--path', action='append', choices=sorted(PATHS), help='decode paths to run (default all)')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args(argv)
+
+    stream, frames = build_stream(args.exchanges, args.seed, args.corrupt_rate)
+    results = [bench(path, stream, frames, args.repeat) for path in args.path or PATHS]
+
+    if args.json:
+        print(json.dumps({'frames': frames, 'bytes': len(stream), 'results': results}, indent=2))
+    else:
+        print('{} frames, {} bytes'.format(frames, len(stream)))
+        for result in results:
+            print_result(result)
+
+
+if __name__ == '__main__':
+    main()
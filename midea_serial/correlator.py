@@ -0,0 +1,178 @@
+##
+## Copyright (C) 2020 David Lobato <dav.lobato@gmail.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Request/response correlation and round-trip latency statistics.
+'''
+
+from collections import OrderedDict
+from .engine import Frame, FrameDecoder, ANN_ERROR, ANN_EXCHANGE, MSG_TYPE_OFFSET, APPLIANCE_TYPE_OFFSET, MSG_ID_OFFSET
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, p):
+    # nearest rank
+    index = max(0, -(-len(sorted_values) * p // 100) - 1)
+    return sorted_values[index]
+
+
+def format_latency(samples, samplerate):
+    if samplerate:
+        return '{} samples ({:.3f} ms)'.format(samples, samples * 1e3 / samplerate)
+    return '{} samples'.format(samples)
+
+
+class Correlator:
+    '''
+    Matches requests with their responses by message type, msg id and
+    direction. A request is answered by the first response going the other
+    way with the same message type and msg id; latency is measured from the
+    end of the request to the start of the response.
+
+    add() returns the annotations for the frame as (ss, es, ann_class, texts)
+    tuples: the request/response pair, requests left unanswered for more
+    than timeout samples (or replaced by a new request) and unsolicited
+    responses.
+    '''
+
+    def __init__(self, timeout=None, samplerate=None, cmd_table=FrameDecoder.cmd_table):
+        self.timeout = timeout
+        self.samplerate = samplerate
+        self.cmd_table = cmd_table
+        self.reset()
+
+    def reset(self):
+        # pending requests in arrival order, (direction, msg_type, msg_id) -> frame
+        self.pending = OrderedDict()
+        self.latencies = {}  # msg_type -> [samples]
+        self.unanswered = {}  # msg_type -> count
+        self.unsolicited = {}  # msg_type -> count
+
+    def checkpoint(self):
+        '''
+        The pending requests and statistics as a dict of plain values, see
+        restore().
+        '''
+        return {
+            'pending': [(key, (frame.rxtx, frame.data, frame.ss, frame.es_sync, frame.ss_header, frame.es_header,
+                               frame.ss_msg, frame.es)) for key, frame in self.pending.items()],
+            'latencies': self.latencies,
+            'unanswered': self.unanswered,
+            'unsolicited': self.unsolicited,
+        }
+
+    def restore(self, checkpoint):
+        self.reset()
+        self.pending = OrderedDict((tuple(key), Frame(*args)) for key, args in checkpoint['pending'])
+        self.latencies = {msg_type: list(latencies) for msg_type, latencies in checkpoint['latencies'].items()}
+        self.unanswered = dict(checkpoint['unanswered'])
+        self.unsolicited = dict(checkpoint['unsolicited'])
+
+    def add(self, frame):
+        annotations = []
+        if self.timeout is not None:
+            self.expire(frame.ss, annotations)
+
+        if not frame.checksum_ok:
+            return annotations
+
+        data = frame.data
+        msg_type = data[MSG_TYPE_OFFSET]
+        spec = self.cmd_table[(msg_type << 8) | data[APPLIANCE_TYPE_OFFSET]]
+        if spec.direction is None or not spec.response:
+            return annotations
+
+        key = (spec.direction, msg_type, data[MSG_ID_OFFSET])
+        if frame.rxtx == spec.direction:
+            request = self.pending.pop(key, None)
+            if request is not None:
+                self.flag_unanswered(request, annotations)
+            self.pending[key] = frame
+        else:
+            request = self.pending.pop(key, None)
+            if request is None:
+                self.unsolicited[msg_type] = self.unsolicited.get(msg_type, 0) + 1
+                annotations.append((frame.ss, frame.es, ANN_ERROR,
+                                    ['Unsolicited response 0x{:02X}'.format(msg_type), '!<0x{:02X}'.format(msg_type)]))
+            else:
+                latency = frame.ss - request.es
+                self.latencies.setdefault(msg_type, []).append(latency)
+                latency_str = format_latency(latency, self.samplerate)
+                annotations.append((request.ss, frame.es, ANN_EXCHANGE, [
+                    'Request/Response 0x{:02X}: {}'.format(msg_type, latency_str),
+                    '0x{:02X} {}'.format(msg_type, latency_str),
+                    '0x{:02X}'.format(msg_type)]))
+        return annotations
+
+    def expire(self, ss, annotations):
+        while self.pending:
+            key, request = next(iter(self.pending.items()))
+            if ss - request.es <= self.timeout:
+                break
+            del self.pending[key]
+            self.flag_unanswered(request, annotations)
+
+    def flush(self):
+        '''
+        Flag the requests still pending at the end of the capture as
+        unanswered, returns their annotations.
+        '''
+        annotations = []
+        while self.pending:
+            _, request = self.pending.popitem(last=False)
+            self.flag_unanswered(request, annotations)
+        return annotations
+
+    def flag_unanswered(self, request, annotations):
+        msg_type = request.data[MSG_TYPE_OFFSET]
+        self.unanswered[msg_type] = self.unanswered.get(msg_type, 0) + 1
+        annotations.append((request.ss, request.es, ANN_ERROR,
+                            ['Request 0x{:02X} not answered'.format(msg_type), '!0x{:02X}>'.format(msg_type)]))
+
+    def latency_stats(self):
+        '''
+        Per message type latency statistics in samples: count, min, the
+        PERCENTILES and max.
+        '''
+        stats = {}
+        for msg_type, latencies in self.latencies.items():
+            latencies = sorted(latencies)
+            stats[msg_type] = dict(count=len(latencies), min=latencies[0], max=latencies[-1],
+                                   **{'p{}'.format(p): percentile(latencies, p) for p in PERCENTILES})
+        return stats
+
+    def summary(self):
+        lines = []
+        stats = self.latency_stats()
+        # requests still pending count as unanswered, see flush()
+        unanswered = dict(self.unanswered)
+        for _, msg_type, _ in self.pending:
+            unanswered[msg_type] = unanswered.get(msg_type, 0) + 1
+        for msg_type in sorted(set(stats) | set(unanswered) | set(self.unsolicited)):
+            line = '0x{:02X}: '.format(msg_type)
+            if msg_type in stats:
+                s = stats[msg_type]
+                line += '{} responses, '.format(s['count']) + ', '.join(
+                    '{} {}'.format(name, format_latency(s[name], self.samplerate))
+                    for name in ['min'] + ['p{}'.format(p) for p in PERCENTILES] + ['max'])
+            else:
+                line += '0 responses'
+            line += ', {} unanswered, {} unsolicited'.format(unanswered.get(msg_type, 0),
+                                                             self.unsolicited.get(msg_type, 0))
+            lines.append(line)
+        return lines
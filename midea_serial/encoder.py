@@ -0,0 +1,204 @@
+##
+## Copyright (C) 2020 David Lobato <dav.lobato@gmail.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Midea Serial frame encoder, used to generate synthetic traffic.
+'''
+
+import random
+from .util import crc8, checksum
+from .engine import FrameDecoder, RX, TX, HEADER_LENGTH, LENGTH_OFFSET, MSG_TYPE_OFFSET, MSG_BODY_OFFSET
+from .ac import ac_mode_str, ac_fan_speed_str
+
+AC_BODY_LENGTH = 24  # msg id included, CRC8 not included
+
+CORRUPTIONS = ('checksum', 'crc', 'length', 'byte', 'truncate')
+
+
+def encode_frame(msg_type, body=b'', appliance_type=0xAC, msg_id=0, framework_version=0, appliance_version=0):
+    '''
+    Encode a frame: 0xAA sync, header, body and checksum.
+    '''
+    data = bytearray(HEADER_LENGTH + 1)
+    data[LENGTH_OFFSET] = HEADER_LENGTH + 1 + len(body) + 1
+    data[1] = appliance_type
+    data[5] = msg_id
+    data[6] = framework_version
+    data[7] = appliance_version
+    data[MSG_TYPE_OFFSET] = msg_type
+    data += body
+    data.append(checksum(data))
+    return b'\xaa' + bytes(data)
+
+
+def with_crc8(body):
+    return bytes(body) + bytes([crc8(body)])
+
+
+def encode_ac_control(msg_id=0, power=True, mode=2, setpoint=24.0, fan_speed=102, horizontal_swing=False,
+                      vertical_swing=False):
+    '''
+    0x02/0xAC module->appliance control body, CRC8 included.
+    '''
+    body = bytearray(AC_BODY_LENGTH)
+    body[0] = 0x40
+    body[1] = 0x02 | (0x01 if power else 0)  # remoteControlMode
+    body[2] = (mode << 5) | (0x10 if setpoint % 1 else 0) | (int(setpoint) - 16) & 0x0F
+    body[3] = fan_speed
+    body[7] = 0x30 | (0xC0 if horizontal_swing else 0) | (0x03 if vertical_swing else 0)
+    body[-1] = msg_id
+    return with_crc8(body)
+
+
+def encode_ac_status(msg_id=0, power=True, mode=2, setpoint=24.0, fan_speed=102, horizontal_swing=False,
+                     vertical_swing=False, indoor_temperature=25.0, outdoor_temperature=30.0, error_code=0):
+    '''
+    0x02/0xAC appliance->module status body, CRC8 included.
+    '''
+    body = bytearray(AC_BODY_LENGTH)
+    body[0] = 0xC0
+    body[1] = (0x80 if error_code else 0) | (0x01 if power else 0)
+    body[2] = (mode << 5) | (0x10 if setpoint % 1 else 0) | (int(setpoint) - 16) & 0x0F
+    body[3] = fan_speed
+    body[7] = 0x30 | (0xC0 if horizontal_swing else 0) | (0x03 if vertical_swing else 0)
+    body[11] = int(indoor_temperature * 2 + 50) & 0xFF
+    body[12] = int(outdoor_temperature * 2 + 50) & 0xFF
+    body[16] = error_code
+    body[-1] = msg_id
+    return with_crc8(body)
+
+
+def encode_ac_query(msg_id=0):
+    '''
+    0x03/0xAC module->appliance query body, CRC8 included.
+    '''
+    body = bytearray(AC_BODY_LENGTH - 3)
+    body[0] = 0x41
+    body[1] = 0x81
+    body[3] = 0xFF
+    body[4] = 0x03
+    body[5] = 0xFF
+    body[7] = 0x02
+    body[-1] = msg_id
+    return with_crc8(body)
+
+
+def encode_network_status(ip_address=(192, 168, 1, 100), network_status=0, cloud_status=0):
+    '''
+    0x63 module->appliance network status response body.
+    '''
+    body = bytearray(20)
+    body[0] = 1  # Wi-Fi
+    body[1] = 2  # STA
+    body[2] = 4
+    body[3:7] = bytes(reversed(ip_address))
+    body[7] = 0xFF
+    body[8] = network_status
+    body[9] = cloud_status
+    body[11] = 1
+    return bytes(body)
+
+
+def corrupt(frame, kind, rng=random):
+    '''
+    Return a copy of an encoded frame damaged as described by kind, one of
+    CORRUPTIONS.
+    '''
+    frame = bytearray(frame)
+    if kind == 'checksum':
+        frame[-1] ^= 0xFF
+    elif kind == 'crc':
+        # flip a body bit and fix the checksum, only CRC8 protected bodies notice
+        frame[1 + MSG_BODY_OFFSET] ^= 0x01
+        frame[-1] = checksum(frame[1:-1])
+    elif kind == 'length':
+        frame[1 + LENGTH_OFFSET] = rng.randrange(0x100)
+    elif kind == 'byte':
+        frame[rng.randrange(1, len(frame))] ^= 1 << rng.randrange(8)
+    elif kind == 'truncate':
+        del frame[rng.randrange(1, len(frame)):]
+    else:
+        raise ValueError('Unknown corruption: {}'.format(kind))
+    return bytes(frame)
+
+
+def random_ac_state(rng=random):
+    return dict(power=rng.random() < 0.9, mode=rng.choice(list(ac_mode_str)), setpoint=rng.randrange(34, 60) / 2,
+                fan_speed=rng.choice(list(ac_fan_speed_str)), horizontal_swing=rng.random() < 0.5,
+                vertical_swing=rng.random() < 0.5)
+
+
+def message_pair(msg_type, appliance_type, rng=random, msg_id=0, ac_state=None, temperatures=(25.0, 30.0)):
+    '''
+    Encode a request and its response, if one is expected, for msg_type.
+    ac_state holds the encode_ac_control() arguments, random if not given.
+    Returns a list of (rxtx, frame) tuples.
+    '''
+    FrameDecoder.load_appliance(appliance_type)
+    spec = FrameDecoder.cmd_table[(msg_type << 8) | appliance_type]
+    if (msg_type, appliance_type) in ((0x02, 0xAC), (0x03, 0xAC)):
+        if ac_state is None:
+            ac_state = random_ac_state(rng)
+        if msg_type == 0x02:
+            request = encode_ac_control(msg_id, **ac_state)
+        else:
+            request = encode_ac_query(msg_id)
+        response = encode_ac_status(msg_id, indoor_temperature=temperatures[0], outdoor_temperature=temperatures[1],
+                                    **ac_state)
+    elif msg_type == 0x63:
+        request = b'\x00'
+        response = encode_network_status()
+    elif msg_type == 0x81:
+        request = bytes([rng.choice((1, 2))])
+        response = bytes([rng.choice((0, 1, 2))])
+    else:
+        request = bytes(rng.randrange(0x100) for _ in range(rng.randrange(1, 16)))
+        response = b'\x00'
+
+    pair = [(spec.direction, encode_frame(msg_type, request, appliance_type, msg_id))]
+    if spec.response:
+        pair.append((RX if spec.direction == TX else TX, encode_frame(msg_type, response, appliance_type, msg_id)))
+    return pair
+
+
+def generate_traffic(count, seed=None, corrupt_rate=0.0, status_ratio=0.8, change_rate=0.05, appliance_type=0xAC):
+    '''
+    Generate count request/response exchanges as (rxtx, frame) tuples. Roughly
+    status_ratio of them are the periodic 0x02/0x03 AC polls, the rest cover
+    every registered message type. The AC state and temperatures change with
+    probability change_rate on each exchange. corrupt_rate is the
+    probability of a frame being damaged with one of CORRUPTIONS.
+    '''
+    rng = random.Random(seed)
+    ac_state = random_ac_state(rng)
+    temperatures = (25.0, 30.0)
+    FrameDecoder.load_appliance(appliance_type)
+    msg_types = sorted({msg_type for msg_type, _ in FrameDecoder.cmd_specs
+                        if FrameDecoder.cmd_table[(msg_type << 8) | appliance_type].name is not None})
+    for i in range(count):
+        if rng.random() < status_ratio:
+            msg_type = rng.choice((0x02, 0x03))
+        else:
+            msg_type = rng.choice(msg_types)
+        if rng.random() < change_rate:
+            ac_state = random_ac_state(rng)
+        if rng.random() < change_rate:
+            temperatures = (rng.randrange(30, 60) / 2, rng.randrange(0, 80) / 2)
+        for rxtx, frame in message_pair(msg_type, appliance_type, rng, i & 0xFF, ac_state, temperatures):
+            if corrupt_rate and rng.random() < corrupt_rate:
+                frame = corrupt(frame, rng.choice(CORRUPTIONS), rng)
+            yield rxtx, frame
@@ -0,0 +1,550 @@
+##
+## Copyright (C) 2020 David Lobato <dav.lobato@gmail.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Frame decoding engine for the Midea Serial protocol.
+
+This module doesn't depend on libsigrokdecode, it can be used to decode
+byte dumps from a plain Python process:
+
+    engine = FrameDecoder()
+    for frame in engine.decode(open('dump.bin', 'rb').read()):
+        print(frame.msg_type, frame.annotations)
+'''
+
+import importlib
+from .util import checksum
+
+RX = 0
+TX = 1
+rxtx_channels = ('RX', 'TX')
+
+HEADER_LENGTH = 8  # sync byte not included
+LENGTH_OFFSET = 0
+APPLIANCE_TYPE_OFFSET = 1
+MSG_ID_OFFSET = 5
+FRAMEWORK_VERSION_OFFSET = 6
+APPLIANCE_VERSION_OFFSET = 7
+MSG_TYPE_OFFSET = 8
+MSG_BODY_OFFSET = 9
+
+# annotation classes, must match midea_serial.pd.Decoder.annotations
+ANN_CMD = 6  # + rxtx
+ANN_ERROR = 8
+ANN_EXCHANGE = 9
+ANN_STATE = 11  # + rxtx
+
+# frame length limits, sync byte not included. The length byte caps the
+# frame size and a frame has at least the header, msg type and checksum.
+MAX_FRAME_LENGTH = 0xFF
+MIN_FRAME_LENGTH = HEADER_LENGTH + 2
+
+# FrameDecoder.on_event() events
+EVENT_SYNC, EVENT_HEADER, EVENT_FRAME = range(1, 4)
+
+wifi_mode_req_str = {
+    1: 'Switch to AP mode',
+    2: 'Switch to STA mode',
+}
+
+wifi_mode_res_str = {
+    0: 'The mode has not changed',
+    1: 'Switched from STA to AP mode',
+    2: 'Switched from AP to STA mode',
+}
+
+# message bits from http://chipsc.com/home/views/default/resource/images/111.pdf [1]
+class DecoderState:
+    IDLE, READ_HEADER, READ_MESSAGE = range(3)
+
+
+class Frame:
+    '''
+    A complete frame, sync byte excluded. data holds the bytes from the length
+    byte up to and including the checksum. Annotations produced by the
+    command handlers are stored as (ss, es, ann_class, texts) tuples, handlers
+    parsing the appliance state store it in state.
+    '''
+    __slots__ = ('rxtx', 'data', 'ss', 'es_sync', 'ss_header', 'es_header', 'ss_msg', 'es', 'checksum_ok',
+                 'annotations', 'state')
+
+    def __init__(self, rxtx, data, ss, es_sync, ss_header, es_header, ss_msg, es):
+        self.rxtx = rxtx
+        self.data = data
+        self.ss = ss
+        self.es_sync = es_sync
+        self.ss_header = ss_header
+        self.es_header = es_header
+        self.ss_msg = ss_msg
+        self.es = es
+        self.checksum_ok = checksum(data) == 0
+        self.annotations = []
+        self.state = None  # appliance state parsed from the body, if any
+
+    @property
+    def length(self):
+        return self.data[LENGTH_OFFSET]
+
+    @property
+    def appliance_type(self):
+        return self.data[APPLIANCE_TYPE_OFFSET]
+
+    @property
+    def msg_id(self):
+        return self.data[MSG_ID_OFFSET]
+
+    @property
+    def msg_type(self):
+        return self.data[MSG_TYPE_OFFSET]
+
+    @property
+    def body(self):
+        return memoryview(self.data)[MSG_BODY_OFFSET:-1]
+
+    @property
+    def checksum(self):
+        return self.data[-1]
+
+    @property
+    def raw(self):
+        # frame bytes as seen on the wire, sync byte included
+        return b'\xaa' + self.data
+
+    def as_dict(self):
+        return {
+            'direction': rxtx_channels[self.rxtx],
+            'length': self.length,
+            'appliance_type': self.appliance_type,
+            'msg_id': self.msg_id,
+            'msg_type': self.msg_type,
+            'body': bytes(self.body),
+            'checksum': self.checksum,
+            'checksum_ok': self.checksum_ok,
+            'state': self.state._asdict() if self.state is not None else None,
+        }
+
+    def __repr__(self):
+        return 'Frame(rxtx={}, msg_type=0x{:02X}, appliance_type=0x{:02X}, length={}, checksum_ok={})'.format(
+            self.rxtx, self.msg_type, self.appliance_type, self.length, self.checksum_ok)
+
+
+class CommandSpec:
+    '''
+    Describes a message type: the direction its requests travel (RX for
+    appliance->module, TX for module->appliance), whether the other side is
+    expected to respond, the valid frame lengths and the function decoding
+    it. appliance_type is None for handlers valid for any appliance.
+    '''
+    __slots__ = ('msg_type', 'appliance_type', 'direction', 'response', 'name', 'handler', 'min_length',
+                 'max_length', 'request_texts', 'response_texts')
+
+    def __init__(self, msg_type, appliance_type, handler, direction=RX, response=True, name=None, response_name=None,
+                 min_length=MIN_FRAME_LENGTH, max_length=MAX_FRAME_LENGTH):
+        self.msg_type = msg_type
+        self.appliance_type = appliance_type
+        self.direction = direction
+        self.response = response
+        self.name = name
+        self.handler = handler
+        self.min_length = min_length
+        self.max_length = max_length
+        if name is None:
+            self.request_texts = self.response_texts = None
+        elif response:
+            self.request_texts = [name, '0x{:02X}>'.format(msg_type)]
+            self.response_texts = [response_name or 'Response for ' + name, '<0x{:02X}'.format(msg_type)]
+        else:
+            self.request_texts = [name, '0x{:02X}'.format(msg_type)]
+            self.response_texts = ['Response not expected', '!0x{:02X}'.format(msg_type)]
+
+
+def cmd_handler(msg_type, appliance_type=None, **kwargs):
+    '''
+    Decorator registering a FrameDecoder method as the handler of msg_type
+    when the class is created, kwargs are the CommandSpec ones. Handlers are
+    called as handler(decoder, spec, ss, es, (rxtx, read_data)), read_data
+    being a memoryview of the frame without the checksum.
+    '''
+    def decorator(func):
+        func.cmd_spec = (msg_type, appliance_type, kwargs)
+        return func
+
+    return decorator
+
+
+class FrameDecoder:
+    # (msg_type, appliance_type) -> CommandSpec, see register()
+    cmd_specs = {}
+    # CommandSpec lookup table indexed by msg_type << 8 | appliance_type
+    cmd_table = None
+    # appliance_type -> module with its body decoders, see register_appliance()
+    appliance_modules = {}
+    # appliance types whose module isn't loaded yet, unloaded_spec in cmd_table
+    pending_appliances = set()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._build_cmd_table()
+
+    @classmethod
+    def _build_cmd_table(cls):
+        cls.cmd_specs = dict(cls.cmd_specs)
+        cls.appliance_modules = dict(cls.appliance_modules)
+        cls.pending_appliances = set(cls.pending_appliances)
+        for attr in cls.__dict__.values():
+            if hasattr(attr, 'cmd_spec'):
+                msg_type, appliance_type, kwargs = attr.cmd_spec
+                cls.cmd_specs[(msg_type, appliance_type)] = CommandSpec(msg_type, appliance_type, attr, **kwargs)
+        cls.cmd_table = [cls.default_spec] * 0x10000
+        for msg_type in range(0x100) if cls.pending_appliances else {msg_type for msg_type, _ in cls.cmd_specs}:
+            cls._update_cmd_table(msg_type)
+
+    @classmethod
+    def _update_cmd_table(cls, msg_type):
+        spec = cls.cmd_specs.get((msg_type, None), cls.default_spec)
+        pending = cls.pending_appliances
+        row = msg_type << 8
+        cls.cmd_table[row:row + 0x100] = [cls.unloaded_spec if appliance_type in pending else
+                                          cls.cmd_specs.get((msg_type, appliance_type), spec)
+                                          for appliance_type in range(0x100)]
+
+    @classmethod
+    def _update_cmd_column(cls, appliance_type):
+        for msg_type in range(0x100):
+            if appliance_type in cls.pending_appliances:
+                spec = cls.unloaded_spec
+            else:
+                spec = cls.cmd_specs.get((msg_type, appliance_type),
+                                         cls.cmd_specs.get((msg_type, None), cls.default_spec))
+            cls.cmd_table[(msg_type << 8) | appliance_type] = spec
+
+    @classmethod
+    def register_appliance(cls, appliance_type, module):
+        '''
+        Decode the bodies of appliance_type with module, imported on the
+        first frame of that appliance type (relative names are resolved from
+        this package). Its register(cls) function registers its command
+        handlers, so the body decoders of appliances never seen cost nothing.
+        '''
+        cls.appliance_modules[appliance_type] = module
+        cls.pending_appliances.add(appliance_type)
+        cls._update_cmd_column(appliance_type)
+
+    @classmethod
+    def load_appliance(cls, appliance_type):
+        '''
+        Import the module of appliance_type now, if it isn't yet.
+        '''
+        if appliance_type not in cls.pending_appliances:
+            return
+        module = importlib.import_module(cls.appliance_modules[appliance_type], __package__)
+        cls.pending_appliances.discard(appliance_type)
+        cls._update_cmd_column(appliance_type)
+        module.register(cls)
+
+    @classmethod
+    def register(cls, msg_type, appliance_type=None, handler=None, **kwargs):
+        '''
+        Register the handler for msg_type, optionally only for appliance_type,
+        kwargs are the CommandSpec ones. Without handler, frames get the
+        generic request/response annotations built from name and
+        response_name ('Response for <name>' by default).
+        '''
+        spec = CommandSpec(msg_type, appliance_type, handler if handler is not None else cls.cmd_handler_generic,
+                           **kwargs)
+        cls.cmd_specs[(msg_type, appliance_type)] = spec
+        cls._update_cmd_table(msg_type)
+        return spec
+
+    def __init__(self, on_event=None, timeout=None, debug=False):
+        # on_event(event, rxtx) is called for every EVENT_*, see feed()
+        self.on_event = on_event
+        self.timeout = timeout  # max samples between the bytes of a frame
+        self.debug = debug  # print frame bodies to stdout
+        self.reset()
+
+    def reset(self):
+        self.state = [DecoderState.IDLE, DecoderState.IDLE]
+        # frame buffers, write cursors and sample numbers of the buffered bytes
+        self.data = [bytearray(MAX_FRAME_LENGTH), bytearray(MAX_FRAME_LENGTH)]
+        self.data_len = [0, 0]
+        self.data_ss = [[0] * MAX_FRAME_LENGTH, [0] * MAX_FRAME_LENGTH]
+        self.data_es = [[0] * MAX_FRAME_LENGTH, [0] * MAX_FRAME_LENGTH]
+        self.ss_sync = [None, None]
+        self.es_sync = [None, None]
+        self.frame = None  # last completed frame
+        self.annotations = None
+        self.resyncs = 0
+        self.dropped_bytes = 0
+
+    def checkpoint(self):
+        '''
+        The decoding state as a dict of plain values, restore() continues
+        from it. Only the bytes of the frames being received are kept.
+        '''
+        return {
+            'state': list(self.state),
+            'data': [bytes(self.data[rxtx][:data_len]) for rxtx, data_len in enumerate(self.data_len)],
+            'data_ss': [self.data_ss[rxtx][:data_len] for rxtx, data_len in enumerate(self.data_len)],
+            'data_es': [self.data_es[rxtx][:data_len] for rxtx, data_len in enumerate(self.data_len)],
+            'ss_sync': list(self.ss_sync),
+            'es_sync': list(self.es_sync),
+            'resyncs': self.resyncs,
+            'dropped_bytes': self.dropped_bytes,
+        }
+
+    def restore(self, checkpoint):
+        self.reset()
+        self.state = list(checkpoint['state'])
+        for rxtx, data in enumerate(checkpoint['data']):
+            data_len = len(data)
+            self.data[rxtx][:data_len] = data
+            self.data_len[rxtx] = data_len
+            self.data_ss[rxtx][:data_len] = checkpoint['data_ss'][rxtx]
+            self.data_es[rxtx][:data_len] = checkpoint['data_es'][rxtx]
+        self.ss_sync = list(checkpoint['ss_sync'])
+        self.es_sync = list(checkpoint['es_sync'])
+        self.resyncs = checkpoint['resyncs']
+        self.dropped_bytes = checkpoint['dropped_bytes']
+
+    def feed(self, rxtx, ss, es, byte):
+        '''
+        Feed one byte received in direction rxtx. Events are reported to
+        on_event: on EVENT_SYNC ss_sync/es_sync hold the sync byte samples, on
+        EVENT_HEADER the header is in data and on EVENT_FRAME the decoded
+        frame is in self.frame.
+        '''
+        state = self.state[rxtx]
+
+        if state == DecoderState.IDLE:
+            if byte == 0xAA:  # 0xAA sync header
+                self.data_len[rxtx] = 0
+                self.ss_sync[rxtx] = ss
+                self.es_sync[rxtx] = es
+                self.state[rxtx] = DecoderState.READ_HEADER
+                if self.on_event is not None:
+                    self.on_event(EVENT_SYNC, rxtx)
+            else:
+                self.dropped_bytes += 1
+            return
+
+        data_len = self.data_len[rxtx]
+        if self.timeout is not None and ss - (self.data_es[rxtx][data_len - 1] if data_len else self.es_sync[rxtx]) \
+                > self.timeout:
+            # the rest of the frame is lost, this byte may be the next sync
+            self.dropped_bytes += data_len + 1
+            self.state[rxtx] = DecoderState.IDLE
+            self.feed(rxtx, ss, es, byte)
+            return
+
+        data = self.data[rxtx]
+        data[data_len] = byte
+        self.data_ss[rxtx][data_len] = ss
+        self.data_es[rxtx][data_len] = es
+        data_len += 1
+        self.data_len[rxtx] = data_len
+
+        if state == DecoderState.READ_HEADER:
+            if data_len == HEADER_LENGTH:
+                if data[LENGTH_OFFSET] < MIN_FRAME_LENGTH:
+                    self.resync(rxtx)
+                    return
+                self.state[rxtx] = DecoderState.READ_MESSAGE
+                if self.on_event is not None:
+                    self.on_event(EVENT_HEADER, rxtx)
+        elif data_len == MSG_TYPE_OFFSET + 1:
+            spec = self.cmd_table[(byte << 8) | data[APPLIANCE_TYPE_OFFSET]]
+            if spec is self.unloaded_spec:
+                self.load_appliance(data[APPLIANCE_TYPE_OFFSET])
+                spec = self.cmd_table[(byte << 8) | data[APPLIANCE_TYPE_OFFSET]]
+            if not spec.min_length <= data[LENGTH_OFFSET] <= spec.max_length:
+                self.resync(rxtx)
+        elif data_len == data[LENGTH_OFFSET]:
+            self.state[rxtx] = DecoderState.IDLE
+            # the only copy of the frame, everything else gets memoryview slices of it
+            frame = Frame(rxtx, bytes(memoryview(data)[:data_len]), self.ss_sync[rxtx], self.es_sync[rxtx],
+                          self.data_ss[rxtx][0], self.data_es[rxtx][HEADER_LENGTH - 1],
+                          self.data_ss[rxtx][MSG_TYPE_OFFSET], es)
+            self.frame = frame
+            self.decode_frame(frame, ss)
+            if self.on_event is not None:
+                self.on_event(EVENT_FRAME, rxtx)
+            if not frame.checksum_ok:
+                self.resync(rxtx, frame=True)
+
+    def resync(self, rxtx, frame=False):
+        '''
+        The buffered bytes don't make a valid frame, replay them from the next
+        sync byte so a glitch costs at most one frame. frame tells if they were
+        reported as a frame already, otherwise they count as dropped.
+        '''
+        self.resyncs += 1
+        self.state[rxtx] = DecoderState.IDLE
+        data_len = self.data_len[rxtx]
+        pos = self.data[rxtx].find(0xAA, 0, data_len)
+        if pos < 0:
+            if not frame:
+                self.dropped_bytes += data_len + 1
+            return
+
+        if not frame:
+            self.dropped_bytes += pos + 1
+        # the buffers are overwritten while replaying
+        replay = list(zip(self.data_ss[rxtx][pos:data_len], self.data_es[rxtx][pos:data_len],
+                          self.data[rxtx][pos:data_len]))
+        for ss, es, byte in replay:
+            self.feed(rxtx, ss, es, byte)
+
+    def decode(self, data, rxtx=RX):
+        '''
+        Decode a sequence of bytes or (ss, es, byte) tuples received in
+        direction rxtx, yielding the complete frames. For plain bytes the
+        sample numbers are the byte offsets in data. on_event isn't called
+        while decoding.
+        '''
+        frames = []
+
+        def on_event(event, rxtx):
+            if event == EVENT_FRAME:
+                frames.append(self.frame)
+
+        on_event_saved = self.on_event
+        self.on_event = on_event
+        feed = self.feed
+        try:
+            for i, item in enumerate(data):
+                if isinstance(item, int):
+                    feed(rxtx, i, i, item)
+                else:
+                    feed(rxtx, *item)
+                if frames:
+                    yield from frames
+                    frames.clear()
+        finally:
+            self.on_event = on_event_saved
+
+    def decode_frame(self, frame, ss):
+        # ss is the start sample of the last byte (checksum)
+        self.annotations = frame.annotations
+        if frame.checksum_ok:
+            data = frame.data
+            spec = self.cmd_table[(data[MSG_TYPE_OFFSET] << 8) | data[APPLIANCE_TYPE_OFFSET]]
+            spec.handler(self, spec, frame.ss_msg, frame.es, (frame.rxtx, memoryview(data)[:-1]))
+        else:
+            self.put(ss, frame.es, ANN_ERROR, ['Checksum failed'])
+
+    def put(self, ss, es, ann_class, texts):
+        self.annotations.append((ss, es, ann_class, texts))
+
+    def cmd_handler_default(self, spec, ss, es, data):
+        rxtx, read_data = data
+
+        self.put(ss, es, ANN_CMD + rxtx, ['msg type 0x{:02X}'.format(read_data[MSG_TYPE_OFFSET]),
+                                          '0x{:02X}'.format(read_data[MSG_TYPE_OFFSET])])
+
+    def cmd_handler_generic(self, spec, ss, es, data):
+        rxtx, read_data = data
+
+        if rxtx == spec.direction:
+            self.put(ss, es, ANN_CMD + rxtx, spec.request_texts)
+        elif spec.response:
+            self.put(ss, es, ANN_CMD + rxtx, spec.response_texts)
+        else:
+            self.put(ss, es, ANN_ERROR, spec.response_texts)
+
+    @cmd_handler(0x63, direction=RX, name='Query network status')  # Home appliance query network and signal status
+    def cmd_handler_0x63(self, spec, ss, es, data):
+        rxtx, read_data = data
+
+        if rxtx == spec.direction:  # request from appliance
+            self.cmd_handler_generic(spec, ss, es, data)
+        else:
+            msg_body = read_data[MSG_BODY_OFFSET:]
+            if len(msg_body) < 12:
+                self.put(ss, es, ANN_ERROR, ['Network status response too short', '!<0x63'])
+                return
+            module_type = 'RF' if msg_body[0] == 0 else 'Wi-Fi'
+            module_mode = msg_body[1]
+            wifi_signal_strength = msg_body[2]
+            ip_address = msg_body[3:7]
+            rf_signal_strength = msg_body[7]
+            network_status = 'OK' if msg_body[8] == 0 else msg_body[8]
+            cloud_status = 'OK' if msg_body[9] == 0 else msg_body[9]
+            conn_status = msg_body[10]
+            tcp_conn_count = msg_body[11]
+            self.put(ss, es, ANN_CMD + rxtx, [
+                '{}({}), IP: {}.{}.{}.{}, Net Status: {}, Cloud status: {}'.format(module_type, module_mode,
+                                                                                   ip_address[3], ip_address[2],
+                                                                                   ip_address[1], ip_address[0],
+                                                                                   network_status, cloud_status),
+                '<0x63'])
+
+    @cmd_handler(0x81, direction=RX, name='Wi-Fi working mode switch', min_length=MIN_FRAME_LENGTH + 1)
+    def cmd_handler_0x81(self, spec, ss, es, data):
+        rxtx, read_data = data
+
+        msg_body = read_data[MSG_BODY_OFFSET:]
+
+        if rxtx == spec.direction:
+            req_str = wifi_mode_req_str[msg_body[0]] if msg_body[0] in wifi_mode_req_str else 'Switch to unknown mode'
+            self.put(ss, es, ANN_CMD + rxtx, [req_str, '0x81>'])
+        else:
+            res_str = wifi_mode_res_str[msg_body[0]] if msg_body[0] in wifi_mode_res_str else 'Unknown response'
+            self.put(ss, es, ANN_CMD + rxtx, [res_str, '<0x81'])
+
+    @cmd_handler(0x82, direction=RX, name='Wi-Fi module restart', min_length=MIN_FRAME_LENGTH + 1)
+    def cmd_handler_0x82(self, spec, ss, es, data):
+        rxtx, read_data = data
+
+        msg_body = read_data[MSG_BODY_OFFSET:]
+
+        if rxtx == spec.direction:
+            self.cmd_handler_generic(spec, ss, es, data)
+        else:
+            res_str = 'Restart successful' if msg_body[0] == 0 else 'Restart failed'
+            self.put(ss, es, ANN_CMD + rxtx, [res_str, '<0x82'])
+
+
+FrameDecoder.default_spec = CommandSpec(None, None, FrameDecoder.cmd_handler_default, direction=None, response=False)
+# placeholder of the appliance types not loaded yet, feed() loads them
+FrameDecoder.unloaded_spec = CommandSpec(None, None, FrameDecoder.cmd_handler_default, direction=None, response=False)
+FrameDecoder._build_cmd_table()
+
+FrameDecoder.register_appliance(0xAC, '.ac')
+
+# appliance -> module
+FrameDecoder.register(0x04, direction=RX, response=False, name='Equipment operating parameters report')
+FrameDecoder.register(0x05, direction=RX, name='Equipment operating parameters report with response',
+                      response_name='Response for Equipment operating parameters report')
+FrameDecoder.register(0x06, direction=RX, response=False, name='Equipment abnormal event reporting')
+FrameDecoder.register(0x0A, direction=RX, name='Equipment abnormal event reporting with response',
+                      response_name='Response for Equipment abnormal event reporting')
+FrameDecoder.register(0x12, direction=RX, name='SSID rename')
+FrameDecoder.register(0x61, direction=RX, name='Time adjustment')
+FrameDecoder.register(0x68, direction=RX, name='Switch Wi-Fi signal command')
+FrameDecoder.register(0x6A, direction=RX, name='Wi-Fi parameter configuration')
+FrameDecoder.register(0x6B, direction=RX, name='Home appliance query AP list')
+FrameDecoder.register(0x83, direction=RX, name='Restore factory settings of Wi-Fi module')
+
+# module -> appliance
+FrameDecoder.register(0x02, direction=TX, name='Device control command')
+FrameDecoder.register(0x03, direction=TX, name='Device query command')
+FrameDecoder.register(0x07, direction=TX, name='Device electronic ID acquisition')
+FrameDecoder.register(0x0D, direction=TX, response=False, name='Device networking notification')
+FrameDecoder.register(0x11, direction=TX, name='Write device electronic ID')
+FrameDecoder.register(0x13, direction=TX, name='Read MAC address')
+FrameDecoder.register(0xA0, direction=TX, name='Home appliance model and basic information query')
@@ -0,0 +1,196 @@
+##
+## Copyright (C) 2020 David Lobato <dav.lobato@gmail.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Columnar export of decoded frames.
+
+    python -m midea_serial.export capture.sr frames.parquet --rx D0 --tx D1
+
+One row per frame with typed columns, written to CSV, NumPy .npz (requires
+NumPy) or Parquet (requires pyarrow) depending on the output extension.
+direction is 0 for RX and 1 for TX. The AC state columns are the fields of
+the AC control and status bodies, frames without one of them have -1 in the
+integer columns and NaN in the float ones.
+'''
+
+import argparse
+import csv
+import os
+from array import array
+from .ac import AC_CONTROL, AC_STATUS
+from .engine import EVENT_FRAME, rxtx_channels
+
+# (name, array typecode, missing value) of the frame columns
+FRAME_COLUMNS = (
+    ('ss', 'q', None),
+    ('es', 'q', None),
+    ('direction', 'B', None),
+    ('msg_type', 'B', None),
+    ('appliance_type', 'B', None),
+    ('msg_id', 'B', None),
+    ('checksum_ok', 'B', None),
+)
+
+
+def state_columns(specs):
+    '''
+    The columns of the fields of the FieldSpecs specs, each name once: bool
+    fields are stored as int8, converted or scaled ones as float64 and the
+    others (a body byte at most) as int16.
+    '''
+    columns = {}
+    for spec in specs:
+        for field in spec.fields:
+            if field.name in columns:
+                continue
+            if field.kind is bool:
+                columns[field.name] = (field.name, 'b', -1)
+            elif field.convert is not None or field.scale is not None:
+                columns[field.name] = (field.name, 'd', float('nan'))
+            else:
+                columns[field.name] = (field.name, 'h', -1)
+    return tuple(columns.values())
+
+
+# AC state fields, see midea_serial.ac
+STATE_COLUMNS = state_columns((AC_CONTROL, AC_STATUS))
+
+COLUMNS = FRAME_COLUMNS + STATE_COLUMNS
+
+FORMATS = ('csv', 'npz', 'parquet')
+
+# rows buffered before a chunk is written
+CHUNK_SIZE = 1 << 16
+
+
+class FrameExporter:
+    '''
+    Buffers frames in typed arrays and writes them to path in chunks of
+    chunk_size rows. fmt is one of FORMATS, by default taken from the path
+    extension. An .npz archive can't be appended to, so its chunks are kept
+    as NumPy arrays and saved on close().
+    '''
+
+    def __init__(self, path, fmt=None, chunk_size=CHUNK_SIZE):
+        if fmt is None:
+            fmt = os.path.splitext(path)[1][1:].lower()
+        if fmt not in FORMATS:
+            raise ValueError('Unknown export format: {}'.format(fmt))
+        if fmt == 'parquet':
+            try:
+                import pyarrow
+            except ImportError:
+                raise ImportError('Parquet export requires pyarrow, use csv or npz') from None
+        self.path = path
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.columns = [array(typecode) for _, typecode, _ in COLUMNS]
+        self.file = None
+        self.writer = None
+        self.chunks = []
+
+    def add(self, frame):
+        values = (frame.ss, frame.es, frame.rxtx, frame.msg_type, frame.appliance_type, frame.msg_id,
+                  frame.checksum_ok)
+        for column, value in zip(self.columns, values):
+            column.append(value)
+        state = frame.state
+        for column, (name, _, missing) in zip(self.columns[len(FRAME_COLUMNS):], STATE_COLUMNS):
+            value = getattr(state, name, None)
+            column.append(missing if value is None else value)
+        self.rows += 1
+        if len(self.columns[0]) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not len(self.columns[0]):
+            return
+        getattr(self, 'write_' + self.fmt)()
+        self.columns = [array(typecode) for _, typecode, _ in COLUMNS]
+
+    def write_csv(self):
+        if self.writer is None:
+            self.file = open(self.path, 'w', newline='')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow([name for name, _, _ in COLUMNS])
+        self.writer.writerows(zip(*self.columns))
+
+    def write_npz(self):
+        import numpy as np
+        self.chunks.append([np.frombuffer(column, dtype=column.typecode).copy() for column in self.columns])
+
+    def write_parquet(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        arrays = {name: pa.array(column) for (name, _, _), column in zip(COLUMNS, self.columns)}
+        arrays['checksum_ok'] = arrays['checksum_ok'].cast(pa.bool_())
+        table = pa.table(arrays)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        self.flush()
+        if self.fmt == 'npz':
+            import numpy as np
+            if self.chunks:
+                arrays = [np.concatenate(chunk) for chunk in zip(*self.chunks)]
+            else:
+                arrays = [np.zeros(0, dtype=typecode) for _, typecode, _ in COLUMNS]
+            np.savez(self.path, **{name: values for (name, _, _), values in zip(COLUMNS, arrays)})
+        elif self.fmt == 'csv':
+            if self.file is None:
+                self.write_csv()
+            self.file.close()
+        elif self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv=None):
+    from .batch import feed_capture
+    from .engine import FrameDecoder
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('capture', help='.sr session file or raw UART dump')
+    parser.add_argument('output', help='output file, .csv, .npz or .parquet')
+    parser.add_argument('--format', choices=FORMATS, help='output format (default from the extension)')
+    parser.add_argument('--rx', default='0', help='RX channel name or bit number of session files')
+    parser.add_argument('--tx', default='1', help='TX channel name or bit number of session files')
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--direction', choices=rxtx_channels, default='RX', help='direction of raw dumps')
+    args = parser.parse_args(argv)
+
+    try:
+        exporter = FrameExporter(args.output, args.format)
+    except (ValueError, ImportError) as e:
+        parser.error(str(e))
+    with exporter:
+        engine = FrameDecoder()
+        engine.on_event = lambda event, rxtx: exporter.add(engine.frame) if event == EVENT_FRAME else None
+        feed_capture(engine, args.capture, args.rx, args.tx, args.baudrate, rxtx_channels.index(args.direction))
+    print('{} frames written to {}'.format(exporter.rows, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+##
+## Copyright (C) 2020 David Lobato <dav.lobato@gmail.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Declarative message body fields.
+
+Every field is read from a single body byte, so when a FieldSpec is created
+each field is compiled into two 256 entry lookup tables indexed by that
+byte: the typed value and the annotation text. Parsing a body is then one
+table lookup per field, whatever the field does.
+'''
+
+from collections import namedtuple
+
+
+class Field:
+    '''
+    A value stored in body[offset]. The raw value is (byte & mask) >> shift,
+    then:
+
+    - kind=bool: True if any masked bit is set. text is the (false, true)
+      annotation texts, an empty text is left out of the annotation.
+    - convert: function turning the raw value into the field value, for
+      instance lambda raw: (raw - 50) / 2.
+    - scale, add: raw * scale + add.
+    - enum: map of raw values to annotation texts, unknown values are shown
+      with unknown_fmt.
+
+    Fields with a label are annotated as 'label=value' formatted with fmt.
+    '''
+
+    def __init__(self, name, offset, mask=0xFF, shift=0, kind=int, convert=None, scale=None, add=0, enum=None,
+                 label=None, fmt='{}', unknown_fmt='unknown({})', text=('off', 'on')):
+        self.name = name
+        self.offset = offset
+        self.mask = mask
+        self.shift = shift
+        self.kind = kind
+        self.convert = convert
+        self.scale = scale
+        self.add = add
+        self.enum = enum
+        self.label = label
+        self.fmt = fmt
+        self.unknown_fmt = unknown_fmt
+        self.text = text
+
+    def value(self, byte):
+        raw = (byte & self.mask) >> self.shift
+        if self.kind is bool:
+            return bool(raw)
+        if self.convert is not None:
+            return self.convert(raw)
+        if self.scale is not None:
+            return raw * self.scale + self.add
+        return raw
+
+    def format(self, value):
+        if self.kind is bool:
+            text = self.text[value]
+        elif self.enum is not None:
+            text = self.enum[value] if value in self.enum else self.unknown_fmt.format(value)
+        else:
+            text = self.fmt.format(value)
+        if self.label is not None and text:
+            return '{}={}'.format(self.label, text)
+        return text
+
+
+class FieldSpec:
+    '''
+    The fields of a message body. parse() returns them as a namedtuple named
+    name, describe() the annotation text of the fields listed in annotate,
+    in that order: field names, or Fields that are only annotated. The
+    parsed records keep their FieldSpec in record.spec.
+
+    Records can only be pickled if the module defining the spec is given as
+    module and exports the record class as name.
+    '''
+
+    def __init__(self, name, fields, annotate=(), module=None):
+        self.name = name
+        self.fields = tuple(fields)
+        self.record = namedtuple(name, [field.name for field in self.fields], module=module)
+        self.record.spec = self
+        self.length = max(field.offset for field in self.fields) + 1
+        self.by_name = by_name = {field.name: field for field in self.fields}
+
+        # compiled (offset, table) pairs
+        self.values = [(field.offset, [field.value(byte) for byte in range(0x100)]) for field in self.fields]
+        annotate = [by_name[field] if isinstance(field, str) else field for field in annotate]
+        self.texts = [(field.offset, [field.format(field.value(byte)) for byte in range(0x100)]) for field in annotate]
+
+    def parse(self, body):
+        return self.record._make([table[body[offset]] for offset, table in self.values])
+
+    def describe(self, body):
+        return ', '.join([text for text in [table[body[offset]] for offset, table in self.texts] if text])
@@ -0,0 +1,292 @@
+##
+## Copyright (C) 2020 David Lobato <dav.lobato@gmail.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Sidecar frame index of a capture, to query its frames without decoding it
+again.
+
+    python -m midea_serial.index build capture.sr --rx D0 --tx D1
+    python -m midea_serial.index query capture.sr --msg-type 0x63 --direction RX
+    python -m midea_serial.index query capture.sr --error-code --raw
+
+The index (<capture>.midx) is a 16 byte header followed by one fixed width
+RECORD per frame, sorted by start and end sample. The frame bytes
+are appended to <capture>.midx.frames, each record has their offset. With
+NumPy the index is memory mapped and queried with array masks.
+'''
+
+import argparse
+import mmap
+import os
+import struct
+from collections import namedtuple
+from .engine import ANN_ERROR, EVENT_FRAME, rxtx_channels
+from .util import _numpy
+
+MAGIC = b'MIDX'
+VERSION = 1
+HEADER = struct.Struct('<4sHH8x')
+# ss, es, offset in the frames file, direction, msg type, appliance type, msg id, length, flags, error code
+RECORD = struct.Struct('<qqqBBBBBBBx')
+Record = namedtuple('Record', ('ss', 'es', 'offset', 'direction', 'msg_type', 'appliance_type', 'msg_id', 'length',
+                               'flags', 'error_code'))
+
+# record flags
+FLAG_CHECKSUM_OK = 0x01
+FLAG_ERROR = 0x02  # the frame has error annotations
+FLAG_CRC_FAILED = 0x04
+FLAG_STATE = 0x08  # an appliance state was decoded
+
+INDEX_SUFFIX = '.midx'
+FRAMES_SUFFIX = '.frames'
+
+
+def index_path(capture):
+    return capture + INDEX_SUFFIX
+
+
+def record_dtype(np):
+    return np.dtype([('ss', '<i8'), ('es', '<i8'), ('offset', '<i8'), ('direction', 'u1'), ('msg_type', 'u1'),
+                     ('appliance_type', 'u1'), ('msg_id', 'u1'), ('length', 'u1'), ('flags', 'u1'),
+                     ('error_code', 'u1'), ('pad', 'u1')])
+
+
+class FrameIndexWriter:
+    '''
+    Writes the index of the frames given to add(). Frames come in decoding
+    order, which isn't sample order after a resync: a frame recovered from
+    the bytes of a bad one ends before it. close() sorts the records then.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.index = open(path, 'w+b')
+        self.frames = open(path + FRAMES_SUFFIX, 'wb')
+        self.index.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self.offset = 0
+        self.count = 0
+        self.last = None  # (ss, es) of the last record
+        self.sorted = True
+
+    def add(self, frame):
+        flags = FLAG_CHECKSUM_OK if frame.checksum_ok else 0
+        for _, _, ann_class, texts in frame.annotations:
+            if ann_class == ANN_ERROR:
+                flags |= FLAG_ERROR
+                if texts[0] == 'CRC8 failed':
+                    flags |= FLAG_CRC_FAILED
+        state = frame.state
+        if state is not None:
+            flags |= FLAG_STATE
+        data = frame.data
+        samples = (frame.ss, frame.es)
+        if self.last is not None and samples < self.last:
+            self.sorted = False
+        self.last = samples
+        self.index.write(RECORD.pack(frame.ss, frame.es, self.offset, frame.rxtx, frame.msg_type,
+                                     frame.appliance_type, frame.msg_id, len(data), flags,
+                                     getattr(state, 'error_code', 0)))
+        self.frames.write(data)
+        self.offset += len(data)
+        self.count += 1
+
+    def close(self):
+        if not self.sorted:
+            self.index.seek(HEADER.size)
+            records = self.index.read()
+            np = _numpy()
+            if np is not None:
+                records = np.frombuffer(records, dtype=record_dtype(np))
+                records = records[np.lexsort((records['es'], records['ss']))].tobytes()
+            else:
+                records = b''.join(RECORD.pack(*record) for record in sorted(RECORD.iter_unpack(records),
+                                                                             key=lambda record: record[:2]))
+            self.index.seek(HEADER.size)
+            self.index.write(records)
+            self.sorted = True
+        self.index.close()
+        self.frames.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FrameIndex:
+    '''
+    A frame index opened for queries. query() returns the matching record
+    numbers, which record(), sample_ranges() and raw() turn into records,
+    (ss, es) ranges and frames (sync byte included).
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+        magic, version, record_size = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError('{} is not a version {} frame index'.format(path, VERSION))
+        self.count = (os.path.getsize(path) - HEADER.size) // RECORD.size
+        self.np = np = _numpy()
+        if np is not None:
+            dtype = record_dtype(np)
+            self.records = np.memmap(path, dtype=dtype, mode='r', offset=HEADER.size, shape=(self.count,)) \
+                if self.count else np.zeros(0, dtype=dtype)
+        else:
+            with open(path, 'rb') as f:
+                self.records = [Record._make(values) for values in RECORD.iter_unpack(f.read()[HEADER.size:])]
+        self.frames = None
+
+    def __len__(self):
+        return self.count
+
+    def query(self, msg_type=None, direction=None, appliance_type=None, start=None, end=None, errors=None,
+              error_code=None):
+        '''
+        Record numbers of the frames matching all the given conditions:
+        msg_type, direction and appliance_type values, ending in the
+        [start, end] sample range, errors (True for frames with bad checksum
+        or error annotations, False for the others) and error_code (True for
+        any non zero code, or a code).
+        '''
+        np = self.np
+        records = self.records
+        if np is not None:
+            # records are sorted by ss, not es, but a frame ending by end starts by end too
+            hi = self.count if end is None else int(np.searchsorted(records['ss'], end, side='right'))
+            records = records[:hi]
+            mask = np.ones(len(records), dtype=bool)
+            if start is not None:
+                mask &= records['es'] >= start
+            if end is not None:
+                mask &= records['es'] <= end
+            for name, value in (('msg_type', msg_type), ('direction', direction),
+                                ('appliance_type', appliance_type)):
+                if value is not None:
+                    mask &= records[name] == value
+            if errors is not None:
+                failed = ((records['flags'] & FLAG_ERROR) != 0) | ((records['flags'] & FLAG_CHECKSUM_OK) == 0)
+                mask &= failed if errors else ~failed
+            if error_code is True:
+                mask &= records['error_code'] != 0
+            elif error_code is not None:
+                mask &= records['error_code'] == error_code
+            return np.flatnonzero(mask)
+
+        def match(record):
+            if start is not None and record.es < start or end is not None and record.es > end:
+                return False
+            if msg_type is not None and record.msg_type != msg_type or direction is not None and \
+                    record.direction != direction or appliance_type is not None and \
+                    record.appliance_type != appliance_type:
+                return False
+            if errors is not None and errors != bool(record.flags & FLAG_ERROR or
+                                                     not record.flags & FLAG_CHECKSUM_OK):
+                return False
+            if error_code is True:
+                return record.error_code != 0
+            return error_code is None or record.error_code == error_code
+
+        return [row for row, record in enumerate(records) if match(record)]
+
+    def record(self, row):
+        if self.np is not None:
+            return Record._make(self.records[row].tolist()[:len(Record._fields)])
+        return self.records[row]
+
+    def sample_ranges(self, rows):
+        if self.np is not None:
+            records = self.records[rows]
+            return list(zip(records['ss'].tolist(), records['es'].tolist()))
+        return [(self.records[row].ss, self.records[row].es) for row in rows]
+
+    def raw(self, rows):
+        if self.frames is None:
+            with open(self.path + FRAMES_SUFFIX, 'rb') as f:
+                self.frames = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size \
+                    else b''
+        frames = []
+        for row in rows:
+            record = self.record(row)
+            frames.append(b'\xaa' + self.frames[record.offset:record.offset + record.length])
+        return frames
+
+
+def build(capture, path=None, **kwargs):
+    '''
+    Decode a capture file (see batch.feed_capture() for kwargs) and write
+    its index, by default next to it. Returns the number of frames.
+    '''
+    from .batch import feed_capture
+    from .engine import FrameDecoder
+
+    engine = FrameDecoder()
+    with FrameIndexWriter(path or index_path(capture)) as writer:
+        engine.on_event = lambda event, rxtx: writer.add(engine.frame) if event == EVENT_FRAME else None
+        feed_capture(engine, capture, **kwargs)
+    return writer.count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    build_parser = commands.add_parser('build', help='decode a capture and write its index')
+    build_parser.add_argument('capture')
+    build_parser.add_argument('--rx', default='0', help='RX channel name or bit number of session files')
+    build_parser.add_argument('--tx', default='1', help='TX channel name or bit number of session files')
+    build_parser.add_argument('--baudrate', type=int, default=9600)
+    build_parser.add_argument('--direction', choices=rxtx_channels, default='RX', help='direction of raw dumps')
+    query_parser = commands.add_parser('query', help='list the indexed frames matching all the conditions')
+    query_parser.add_argument('capture')
+    query_parser.add_argument('--msg-type', type=lambda value: int(value, 0))
+    query_parser.add_argument('--appliance-type', type=lambda value: int(value, 0))
+    query_parser.add_argument('--direction', choices=rxtx_channels)
+    query_parser.add_argument('--start', type=int, help='first end sample')
+    query_parser.add_argument('--end', type=int, help='last end sample')
+    query_parser.add_argument('--errors', action='store_true', default=None, help='frames with errors')
+    query_parser.add_argument('--error-code', nargs='?', const=True, type=lambda value: int(value, 0),
+                              help='frames with an appliance error code, any non zero one without value')
+    query_parser.add_argument('--raw', action='store_true', help='print the frame bytes')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        count = build(args.capture, rx=args.rx, tx=args.tx, baudrate=args.baudrate,
+                      direction=rxtx_channels.index(args.direction))
+        print('{} frames indexed in {}'.format(count, index_path(args.capture)))
+        return
+
+    index = FrameIndex(index_path(args.capture))
+    rows = index.query(msg_type=args.msg_type, appliance_type=args.appliance_type,
+                       direction=None if args.direction is None else rxtx_channels.index(args.direction),
+                       start=args.start, end=args.end, errors=args.errors, error_code=args.error_code)
+    frames = index.raw(rows) if args.raw else [None] * len(rows)
+    for row, frame in zip(rows, frames):
+        record = index.record(row)
+        line = '{} {} {} 0x{:02X}/0x{:02X} id {}'.format(record.ss, record.es, rxtx_channels[record.direction],
+                                                         record.msg_type, record.appliance_type, record.msg_id)
+        if record.error_code:
+            line += ' error code {}'.format(record.error_code)
+        if frame is not None:
+            line += ' ' + frame.hex().upper()
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+##
+## Copyright (C) 2020 David Lobato <dav.lobato@gmail.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Live decoding of serial ports with asyncio (POSIX only).
+
+    python -m midea_serial.live --rx /dev/ttyUSB0 --tx /dev/ttyUSB1
+    python -m midea_serial.live --emulate 100
+
+A bus is tapped with one serial port per line, the direction of a byte is
+the port it came from. --emulate plays traffic from midea_serial.encoder on a
+pair of ptys and decodes them, no hardware needed.
+'''
+
+import argparse
+import asyncio
+import os
+import termios
+import time
+import tty
+from .encoder import generate_traffic
+from .engine import FrameDecoder, RX, TX, EVENT_FRAME, rxtx_channels
+
+# termios speed constants by baudrate
+_baudrates = {rate: getattr(termios, 'B{}'.format(rate)) for rate in (1200, 2400, 4800, 9600, 19200, 38400, 57600,
+                                                                     115200) if hasattr(termios, 'B{}'.format(rate))}
+
+
+def configure(fd, baudrate):
+    # raw 8N1, no echo nor newline translation
+    tty.setraw(fd)
+    attrs = termios.tcgetattr(fd)
+    attrs[4] = attrs[5] = _baudrates[baudrate]
+    termios.tcsetattr(fd, termios.TCSANOW, attrs)
+
+
+class LiveDecoder:
+    '''
+    Feeds the bytes read from serial ports to a FrameDecoder from the event
+    loop reader callbacks, as soon as they arrive. ss and es of the frames
+    are time.monotonic_ns() timestamps of the reads.
+
+    Decoded frames are queued for frames() up to queue_size, when the
+    consumer falls behind new frames are dropped and counted in
+    dropped_frames. Bytes are never dropped, so the decoding stays in sync.
+    '''
+
+    def __init__(self, queue_size=1024, timeout=None):
+        self.engine = FrameDecoder(on_event=self.handle_event, timeout=timeout)
+        self.queue = asyncio.Queue(queue_size)
+        self.fds = []
+        self.bytes_read = 0
+        self.dropped_frames = 0
+
+    def open(self, path, rxtx=RX, baudrate=9600):
+        '''
+        Decode the bytes of the serial port or pty path as received in
+        direction rxtx. Needs a running event loop.
+        '''
+        fd = os.open(path, os.O_RDONLY | os.O_NOCTTY | os.O_NONBLOCK)
+        if os.isatty(fd):
+            configure(fd, baudrate)
+        asyncio.get_running_loop().add_reader(fd, self.read, fd, rxtx)
+        self.fds.append(fd)
+
+    def close(self):
+        loop = asyncio.get_running_loop()
+        for fd in self.fds:
+            loop.remove_reader(fd)
+            os.close(fd)
+        self.fds = []
+
+    def read(self, fd, rxtx):
+        try:
+            data = os.read(fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            # the other end of a pty went away
+            asyncio.get_running_loop().remove_reader(fd)
+            return
+        now = time.monotonic_ns()
+        self.bytes_read += len(data)
+        feed = self.engine.feed
+        for byte in data:
+            feed(rxtx, now, now, byte)
+
+    def handle_event(self, event, rxtx):
+        if event == EVENT_FRAME:
+            try:
+                self.queue.put_nowait(self.engine.frame)
+            except asyncio.QueueFull:
+                self.dropped_frames += 1
+
+    async def frames(self):
+        while True:
+            yield await self.queue.get()
+
+
+class BusEmulator:
+    '''
+    Plays generate_traffic() frames on two ptys, one per bus line, paced at
+    baudrate with gap seconds between frames. rx_path and tx_path are the
+    pty devices to decode.
+    '''
+
+    def __init__(self, count=100, seed=None, corrupt_rate=0.0, baudrate=9600, gap=0.005):
+        self.count = count
+        self.seed = seed
+        self.corrupt_rate = corrupt_rate
+        self.baudrate = baudrate
+        self.gap = gap
+        self.masters = []
+        self.slaves = []
+        for _ in rxtx_channels:
+            master, slave = os.openpty()
+            configure(slave, baudrate)
+            self.masters.append(master)
+            self.slaves.append(slave)
+        self.rx_path, self.tx_path = [os.ttyname(slave) for slave in self.slaves]
+        self.sent = []  # (monotonic ns, rxtx, frame)
+
+    async def run(self):
+        for rxtx, frame in generate_traffic(self.count, self.seed, self.corrupt_rate):
+            self.sent.append((time.monotonic_ns(), rxtx, frame))
+            os.write(self.masters[rxtx], frame)
+            await asyncio.sleep(len(frame) * 10 / self.baudrate + self.gap)
+
+    def close(self):
+        for fd in self.masters + self.slaves:
+            os.close(fd)
+
+
+async def _main(args):
+    live = LiveDecoder(timeout=int(args.timeout * 1e6) if args.timeout else None)
+    emulator = None
+    if args.emulate:
+        emulator = BusEmulator(args.emulate, args.seed, args.corrupt_rate, args.baudrate)
+        args.rx, args.tx = emulator.rx_path, emulator.tx_path
+    live.open(args.rx, RX, args.baudrate)
+    live.open(args.tx, TX, args.baudrate)
+
+    async def show():
+        start = None
+        async for frame in live.frames():
+            start = frame.ss if start is None else start
+            delay = (time.monotonic_ns() - frame.es) / 1e3
+            print('{:12.6f} {} {} (+{:.0f} us)'.format((frame.ss - start) / 1e9, rxtx_channels[frame.rxtx],
+                                                       '; '.join(texts[0] for _, _, _, texts in frame.annotations),
+                                                       delay))
+
+    printer = asyncio.ensure_future(show())
+    try:
+        if emulator is not None:
+            await emulator.run()
+            await asyncio.sleep(0.1)
+        else:
+            await printer
+    finally:
+        printer.cancel()
+        live.close()
+        if emulator is not None:
+            emulator.close()
+            print('{} frames sent, {} bytes read, {} frames dropped'.format(len(emulator.sent), live.bytes_read,
+                                                                           live.dropped_frames))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rx', help='serial port of the appliance->module line')
+    parser.add_argument('--tx', help='serial port of the module->appliance line')
+    parser.add_argument('--baudrate', type=int, default=9600, choices=sorted(_baudrates))
+    parser.add_argument('--timeout', type=float, help='max ms between the bytes of a frame')
+    parser.add_argument('--emulate', type=int, metavar='EXCHANGES', help='decode an emulated bus instead')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--corrupt-rate', type=float, default=0.0)
+    args = parser.parse_args(argv)
+    if not args.emulate and not (args.rx and args.tx):
+        parser.error('--rx and --tx, or --emulate, are required')
+
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+##
+## Copyright (C) 2020 David Lobato <dav.lobato@gmail.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Decoding of several appliance/module buses watched by one logic analyzer.
+
+    python -m midea_serial.multibus rack.sr --bus ac1=D0:D1 --bus ac2=D2:D3 --stats
+
+Every --bus is a [NAME=]RX:TX pair of channel names (bit numbers for raw
+sample dumps). All the lines are decoded in one pass over the samples with
+midea_serial.uart (requires NumPy), each bus by its own FrameDecoder, and
+frames are printed tagged with their bus name.
+'''
+
+import argparse
+import json
+import zipfile
+from .engine import FrameDecoder, EVENT_FRAME, rxtx_channels
+from .stats import DecoderStats, merge_stats, summary_lines
+
+
+class Bus:
+    '''
+    The decoding state of one bus: its FrameDecoder, counters and the feed
+    function bytes of its lines go to.
+    '''
+    __slots__ = ('id', 'name', 'engine', 'stats', 'feed')
+
+    def __init__(self, bus_id, name, engine, stats=None):
+        self.id = bus_id
+        self.name = name
+        self.engine = engine
+        self.stats = stats
+        if stats is not None:
+            stats.attach(engine)
+        self.feed = engine.feed
+
+
+class MultiBusDecoder:
+    '''
+    Decodes the buses named names. Bytes are fed by line, bus * 2 + rxtx,
+    as given by UartFrontEnd(buses=...), and the frames come out as
+    (bus, frame) tuples in completion order. With stats, every bus gets a
+    DecoderStats and as_dict() adds them up.
+    '''
+
+    def __init__(self, names, timeout=None, stats=False):
+        self.frames = []  # (bus, frame) completed since the last decode() step
+        self.buses = []
+        for bus_id, name in enumerate(names):
+            engine = FrameDecoder(timeout=timeout)
+            bus = Bus(bus_id, name, engine, DecoderStats() if stats else None)
+            engine.on_event = self._frame_collector(bus)
+            self.buses.append(bus)
+
+    def _frame_collector(self, bus):
+        frames = self.frames
+        engine = bus.engine
+
+        def on_event(event, rxtx):
+            if event == EVENT_FRAME:
+                frames.append((bus, engine.frame))
+
+        return on_event
+
+    def reset(self):
+        for bus in self.buses:
+            bus.engine.reset()
+            if bus.stats is not None:
+                bus.stats.reset()
+        self.frames.clear()
+
+    def feed(self, line, ss, es, byte):
+        self.buses[line >> 1].feed(line & 1, ss, es, byte)
+
+    def decode(self, packets):
+        '''
+        Decode the (ss, es, ('DATA', line, (byte, bits))) packets of a
+        UartFrontEnd, yielding (bus, frame) tuples.
+        '''
+        feeds = [bus.feed for bus in self.buses]
+        frames = self.frames
+        for ss, es, (_, line, (byte, _)) in packets:
+            feeds[line >> 1](line & 1, ss, es, byte)
+            if frames:
+                yield from frames
+                frames.clear()
+
+    def as_dict(self):
+        buses = {bus.name: bus.stats.as_dict() for bus in self.buses if bus.stats is not None}
+        return {'buses': buses, 'total': merge_stats(buses.values())}
+
+
+def parse_bus(text, index):
+    name, _, pair = text.rpartition('=')
+    rx, sep, tx = pair.partition(':')
+    if not sep or not rx:
+        raise ValueError('Invalid bus {!r}, expected [NAME=]RX:TX'.format(text))
+    return name or 'bus{}'.format(index), rx, tx or None
+
+
+def main(argv=None):
+    from .uart import SrCapture, UartFrontEnd, raw_chunks
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('capture', help='.sr session file or raw sample dump')
+    parser.add_argument('--bus', action='append', required=True, metavar='[NAME=]RX:TX',
+                        help='RX and TX channels of a bus, TX can be left empty')
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--samplerate', type=int, help='samplerate of a raw dump')
+    parser.add_argument('--unitsize', type=int, default=1, help='bytes per sample word of a raw dump')
+    parser.add_argument('--invert', action='store_true', help='inverted (idle low) lines')
+    parser.add_argument('--stats', action='store_true', help='print the counters of every bus and their total')
+    parser.add_argument('--json', help='write the counters to this file')
+    parser.add_argument('--quiet', action='store_true', help="don't print the frames")
+    args = parser.parse_args(argv)
+
+    try:
+        buses = [parse_bus(text, index) for index, text in enumerate(args.bus)]
+    except ValueError as e:
+        parser.error(str(e))
+
+    if zipfile.is_zipfile(args.capture):
+        capture = SrCapture(args.capture)
+        samplerate, chunks = capture.samplerate, capture.chunks()
+        channel = capture.channel
+    else:
+        if args.samplerate is None:
+            parser.error('--samplerate is required for raw dumps')
+        samplerate, chunks = args.samplerate, raw_chunks(args.capture, args.unitsize)
+        channel = int
+    pairs = [(channel(rx), None if tx is None else channel(tx)) for _, rx, tx in buses]
+
+    uart = UartFrontEnd(samplerate, args.baudrate, invert=args.invert, buses=pairs)
+    decoder = MultiBusDecoder([name for name, _, _ in buses], stats=args.stats or bool(args.json))
+    for bus, frame in decoder.decode(uart.decode(chunks)):
+        if not args.quiet:
+            print('{} {} {} {}'.format(frame.ss, bus.name, rxtx_channels[frame.rxtx],
+                                       '; '.join(texts[0] for _, _, _, texts in frame.annotations)))
+
+    if args.stats or args.json:
+        stats = decoder.as_dict()
+        if args.stats:
+            for name, bus_stats in list(stats['buses'].items()) + [('total', stats['total'])]:
+                print('{}:'.format(name))
+                for line in summary_lines(bus_stats):
+                    print('  ' + line)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(stats, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+##
+## Copyright (C) 2020 David Lobato <dav.lobato@gmail.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Parallel decoding of one raw UART dump split in chunks.
+
+Every chunk is a byte range of the dump decoded by a worker process, which
+reads it from the file itself and starts IDLE. That's only right if no
+frame straddles the chunk start. A decoder that is IDLE after a byte
+doesn't depend on anything it saw before, so a worker is known to be in
+sync with a serial decode from the first byte after which both are IDLE.
+The chunks are stitched together in order: when a frame straddles a chunk
+boundary the bytes from the previous chunk's last IDLE point are decoded
+again in the parent until the serial decoder is IDLE at a point the next
+worker is IDLE too, usually right after the straddling frame.
+
+In a dump the bytes of a frame are consecutive and their offsets are their
+sample numbers, so workers only return the first and last offsets of their
+frames and the parent builds the frames from the file.
+'''
+
+import bisect
+import concurrent.futures
+import mmap
+import os
+from array import array
+from .batch import READ_SIZE
+from .engine import FrameDecoder, Frame, DecoderState, EVENT_FRAME, HEADER_LENGTH, MSG_TYPE_OFFSET, RX
+
+
+def _read(path, start, end):
+    # the bytes of path from start to end, in blocks
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while start < end:
+            block = f.read(min(READ_SIZE, end - start))
+            if not block:
+                break
+            yield start, block
+            start += len(block)
+
+
+def decode_chunk(path, start, end, direction=RX):
+    '''
+    Decode the bytes of the dump at path from offset start to end, received
+    in direction. Returns the first and last offsets (ss, es) of the decoded
+    frames and the offsets after which the decoder is IDLE, as arrays.
+    '''
+    engine = FrameDecoder()
+    # annotations are built by the parent, if at all
+    engine.decode_frame = lambda frame, ss: None
+    frames_ss = array('q')
+    frames_es = array('q')
+    idle = array('q')
+
+    def on_event(event, rxtx):
+        if event == EVENT_FRAME:
+            frames_ss.append(engine.frame.ss)
+            frames_es.append(engine.frame.es)
+
+    engine.on_event = on_event
+    feed = engine.feed
+    state = engine.state
+    for offset, block in _read(path, start, end):
+        for index, byte in enumerate(block, offset):
+            feed(direction, index, index, byte)
+            if state[direction] == DecoderState.IDLE:
+                idle.append(index)
+    return frames_ss, frames_es, idle
+
+
+def _decode_chunk(args):
+    return decode_chunk(*args)
+
+
+def split(count, chunks):
+    size = -(-count // chunks) if count else 1
+    return [(start, min(start + size, count)) for start in range(0, count, size)]
+
+
+class _Stitcher:
+    # merges the chunk results into the (ss, es) of the frames of a serial decode
+
+    def __init__(self, path, direction, bounds, results):
+        self.path = path
+        self.direction = direction
+        self.bounds = bounds
+        self.results = results
+        self.idle_sets = {}
+
+    def stitch(self):
+        frames = []
+        pos = -1  # a serial decode is IDLE after byte pos
+        k = 0
+        while k < len(self.bounds):
+            frames_ss, frames_es, idle = self.results[k]
+            # worker k is in sync after pos, up to its last IDLE point
+            end = idle[-1] if idle and idle[-1] > pos else pos
+            first, last = bisect.bisect_right(frames_es, pos), bisect.bisect_right(frames_es, end)
+            frames.extend(zip(frames_ss[first:last], frames_es[first:last]))
+            if end == self.bounds[k][1] - 1:
+                pos = end
+                k += 1
+                continue
+            # frames completed after end were followed by a resync, they're
+            # decoded again with the straddling frame
+            pos, k = self.resync(end, k, frames)
+        return frames
+
+    def resync(self, pos, k, frames):
+        # decode serially after pos until a worker is in sync, returns the
+        # sync point and that worker
+        engine = FrameDecoder()
+        engine.decode_frame = lambda frame, ss: None
+
+        def on_event(event, rxtx):
+            if event == EVENT_FRAME:
+                frames.append((engine.frame.ss, engine.frame.es))
+
+        engine.on_event = on_event
+        direction = self.direction
+        state = engine.state
+        for offset, block in _read(self.path, pos + 1, self.bounds[-1][1]):
+            for index, byte in enumerate(block, offset):
+                engine.feed(direction, index, index, byte)
+                if state[direction] != DecoderState.IDLE:
+                    continue
+                while index >= self.bounds[k][1]:
+                    k += 1
+                if index == self.bounds[k][1] - 1:
+                    return index, k + 1
+                if index in self.idle_set(k):
+                    return index, k
+        return self.bounds[-1][1] - 1, len(self.bounds)
+
+    def idle_set(self, k):
+        if k not in self.idle_sets:
+            self.idle_sets[k] = set(self.results[k][2])
+        return self.idle_sets[k]
+
+
+def decode_parallel(path, direction=RX, processes=None, chunks=None, annotate=False):
+    '''
+    Decode the raw dump at path, the bytes received in direction, in chunks
+    across processes worker processes (os.cpu_count() by default), yielding
+    the frames a FrameDecoder fed the whole dump would report, in the same
+    order. Their annotations and state are only filled in with annotate,
+    which runs the command handlers in the parent.
+    '''
+    processes = processes or os.cpu_count() or 1
+    bounds = split(os.path.getsize(path), chunks or processes * 4)
+    jobs = [(path, start, end, direction) for start, end in bounds]
+    if processes == 1:
+        results = list(map(_decode_chunk, jobs))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            results = list(executor.map(_decode_chunk, jobs))
+    frames = _Stitcher(path, direction, bounds, results).stitch()
+    if not frames:
+        return
+
+    engine = FrameDecoder()
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as dump:
+        for ss, es in frames:
+            frame = Frame(direction, dump[ss + 1:es + 1], ss, ss, ss + 1, ss + HEADER_LENGTH,
+                          ss + 1 + MSG_TYPE_OFFSET, es)
+            if annotate:
+                engine.frame = frame
+                engine.decode_frame(frame, es)
+            yield frame
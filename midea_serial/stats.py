@@ -0,0 +1,214 @@
+##
+## Copyright (C) 2020 David Lobato <dav.lobato@gmail.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Decoder counters and command handler timings.
+'''
+
+import time
+from .engine import rxtx_channels, ANN_ERROR, MSG_TYPE_OFFSET, APPLIANCE_TYPE_OFFSET
+
+# DecoderState names
+decoder_state_str = ('IDLE', 'READ_HEADER', 'READ_MESSAGE')
+
+
+def spec_name(spec):
+    if spec.name is None:
+        return spec.handler.__name__
+    return '0x{:02X}{} {}'.format(spec.msg_type, '' if spec.appliance_type is None else
+                                  '/0x{:02X}'.format(spec.appliance_type), spec.name)
+
+
+class DecoderStats:
+    '''
+    Counts what a FrameDecoder sees: bytes fed in each DecoderState (bytes
+    replayed after a resync are counted again), frames per direction and
+    message type, checksum and CRC8 failures, responses not expected, and
+    the calls, cumulative and peak time of every command handler.
+
+    attach() wraps the feed() and decode_frame() of one decoder, a decoder
+    that isn't attached runs its usual code and pays nothing.
+    '''
+
+    def __init__(self):
+        self.engine = None
+        self.state_bytes = [[0] * len(decoder_state_str) for _ in rxtx_channels]
+        self.frames = {}  # (rxtx, msg_type) -> count
+        self.handlers = {}  # CommandSpec -> [calls, time, peak time]
+        self.reset()
+
+    def reset(self):
+        # cleared in place, the wrappers made by attach() hold on to the containers
+        self.ss = None  # first sample seen
+        self.es = None  # last sample seen
+        for counts in self.state_bytes:
+            counts[:] = [0] * len(counts)
+        self.frames.clear()
+        self.checksum_failures = 0
+        self.crc_failures = 0
+        self.responses_not_expected = 0
+        self.handlers.clear()
+
+    def checkpoint(self):
+        '''
+        The counters as a dict of plain values, see restore(). Handler
+        timings belong to one run and aren't kept.
+        '''
+        return {
+            'ss': self.ss,
+            'es': self.es,
+            'state_bytes': [list(counts) for counts in self.state_bytes],
+            'frames': [(rxtx, msg_type, count) for (rxtx, msg_type), count in self.frames.items()],
+            'checksum_failures': self.checksum_failures,
+            'crc_failures': self.crc_failures,
+            'responses_not_expected': self.responses_not_expected,
+        }
+
+    def restore(self, checkpoint):
+        self.ss = checkpoint['ss']
+        self.es = checkpoint['es']
+        for counts, saved in zip(self.state_bytes, checkpoint['state_bytes']):
+            counts[:] = saved
+        self.frames.clear()
+        self.frames.update(((rxtx, msg_type), count) for rxtx, msg_type, count in checkpoint['frames'])
+        self.checksum_failures = checkpoint['checksum_failures']
+        self.crc_failures = checkpoint['crc_failures']
+        self.responses_not_expected = checkpoint['responses_not_expected']
+
+    def attach(self, engine):
+        self.engine = engine
+        feed = engine.feed
+        decode_frame = engine.decode_frame
+        perf_counter = time.perf_counter
+        state_bytes = self.state_bytes
+        frames = self.frames
+        handlers = self.handlers
+
+        def counted_feed(rxtx, ss, es, byte):
+            if self.ss is None:
+                self.ss = ss
+            self.es = es
+            state_bytes[rxtx][engine.state[rxtx]] += 1
+            feed(rxtx, ss, es, byte)
+
+        def timed_decode_frame(frame, ss):
+            start = perf_counter()
+            decode_frame(frame, ss)
+            elapsed = perf_counter() - start
+
+            data = frame.data
+            key = (frame.rxtx, data[MSG_TYPE_OFFSET])
+            frames[key] = frames.get(key, 0) + 1
+            if not frame.checksum_ok:
+                self.checksum_failures += 1
+                return
+
+            spec = engine.cmd_table[(data[MSG_TYPE_OFFSET] << 8) | data[APPLIANCE_TYPE_OFFSET]]
+            timing = handlers.get(spec)
+            if timing is None:
+                handlers[spec] = [1, elapsed, elapsed]
+            else:
+                timing[0] += 1
+                timing[1] += elapsed
+                if elapsed > timing[2]:
+                    timing[2] = elapsed
+            for _, _, ann_class, texts in frame.annotations:
+                if ann_class == ANN_ERROR:
+                    if texts[0] == 'CRC8 failed':
+                        self.crc_failures += 1
+                    elif texts[0] == 'Response not expected':
+                        self.responses_not_expected += 1
+
+        # instance attributes shadow the methods, so the engine calls them too
+        engine.feed = counted_feed
+        engine.decode_frame = timed_decode_frame
+        return engine
+
+    def detach(self):
+        if self.engine is not None:
+            del self.engine.feed
+            del self.engine.decode_frame
+            self.engine = None
+
+    def as_dict(self):
+        '''
+        The counters as a JSON serializable dict.
+        '''
+        frames = {channel: {} for channel in rxtx_channels}
+        for (rxtx, msg_type), count in sorted(self.frames.items()):
+            frames[rxtx_channels[rxtx]]['0x{:02X}'.format(msg_type)] = count
+        return {
+            'bytes': {channel: dict(zip(decoder_state_str, self.state_bytes[rxtx]))
+                      for rxtx, channel in enumerate(rxtx_channels)},
+            'frames': frames,
+            'checksum_failures': self.checksum_failures,
+            'crc_failures': self.crc_failures,
+            'responses_not_expected': self.responses_not_expected,
+            'resyncs': self.engine.resyncs if self.engine is not None else None,
+            'dropped_bytes': self.engine.dropped_bytes if self.engine is not None else None,
+            'handlers': {spec_name(spec): {'calls': calls, 'time': total, 'peak': peak}
+                         for spec, (calls, total, peak) in self.handlers.items()},
+        }
+
+    def summary(self):
+        return summary_lines(self.as_dict())
+
+
+def merge_stats(results):
+    '''
+    Adds up DecoderStats.as_dict() results, of the buses of a capture or of
+    several captures. Handler peak times are the maximum.
+    '''
+    total = {'bytes': {channel: dict.fromkeys(decoder_state_str, 0) for channel in rxtx_channels},
+             'frames': {channel: {} for channel in rxtx_channels}, 'handlers': {}}
+    counters = ('checksum_failures', 'crc_failures', 'responses_not_expected', 'resyncs', 'dropped_bytes')
+    total.update(dict.fromkeys(counters, 0))
+    for result in results:
+        for channel in rxtx_channels:
+            for state, count in result['bytes'][channel].items():
+                total['bytes'][channel][state] += count
+            frames = total['frames'][channel]
+            for msg_type, count in result['frames'][channel].items():
+                frames[msg_type] = frames.get(msg_type, 0) + count
+        for name in counters:
+            total[name] += result[name] or 0
+        for name, handler in result['handlers'].items():
+            merged = total['handlers'].setdefault(name, {'calls': 0, 'time': 0.0, 'peak': 0.0})
+            merged['calls'] += handler['calls']
+            merged['time'] += handler['time']
+            merged['peak'] = max(merged['peak'], handler['peak'])
+    for channel in rxtx_channels:
+        total['frames'][channel] = dict(sorted(total['frames'][channel].items()))
+    return total
+
+
+def summary_lines(stats):
+    '''
+    Text lines of a DecoderStats.as_dict() or merge_stats() result.
+    '''
+    lines = ['{}: {} frames, bytes {}'.format(
+        channel, sum(stats['frames'][channel].values()),
+        ', '.join('{} {}'.format(state, count) for state, count in stats['bytes'][channel].items()))
+        for channel in rxtx_channels]
+    lines.append('{} checksum failures, {} CRC8 failures, {} responses not expected, {} resyncs, '
+                 '{} dropped bytes'.format(stats['checksum_failures'], stats['crc_failures'],
+                                           stats['responses_not_expected'], stats['resyncs'],
+                                           stats['dropped_bytes']))
+    for name, handler in sorted(stats['handlers'].items(), key=lambda item: -item[1]['time']):
+        lines.append('{}: {} calls, {:.3f} ms, peak {:.1f} us'.format(
+            name, handler['calls'], handler['time'] * 1e3, handler['peak'] * 1e6))
+    return lines
@@ -0,0 +1,221 @@
+##
+## Copyright (C) 2020 David Lobato <dav.lobato@gmail.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Incremental decoding of growing raw dumps.
+
+    python -m midea_serial.tail rx.bin
+    python -m midea_serial.tail rx.bin --follow 5
+    python -m midea_serial.tail bus.bin --samplerate 1000000 --rx 0 --tx 1 --response-timeout 500000
+
+Every run decodes only the data appended to the dump since the last one,
+resuming from a checkpoint (<dump>.ckpt by default) of the decoder,
+request/response correlation and counters. --follow keeps polling the dump.
+Session files (.sr) are zip archives that can't be read as they grow, so
+only raw dumps are supported: dumps of the UART bytes received in
+--direction, or, with --samplerate, dumps of logic sample words decoded with
+midea_serial.uart (requires NumPy). Requests are only paired with their
+responses in sample dumps, the only ones with both lines and their timing.
+'''
+
+import argparse
+import os
+import pickle
+import time
+from .batch import READ_SIZE
+from .correlator import Correlator
+from .engine import FrameDecoder, RX, EVENT_FRAME, rxtx_channels
+from .stats import DecoderStats
+
+CHECKPOINT_VERSION = 2
+CHECKPOINT_SUFFIX = '.ckpt'
+
+
+class TailDecoder:
+    '''
+    Decodes the dump at path from offset on, update() reads what was
+    appended and returns the new frames with their correlation annotations
+    as (frame, annotations). A dump smaller than offset was truncated or
+    replaced, it's decoded again from the start.
+
+    Without uart the dump has the bytes received in direction, its offsets
+    are the sample numbers and frames aren't correlated. With uart, a
+    UartFrontEnd, the dump has sample words of unitsize bytes and requests
+    are paired with their responses, response_timeout is the Correlator
+    one. timeout is the FrameDecoder one.
+    '''
+
+    def __init__(self, path, direction=RX, timeout=None, response_timeout=None, uart=None, unitsize=1):
+        self.path = path
+        self.direction = direction
+        self.uart = uart
+        self.unitsize = unitsize
+        self.engine = FrameDecoder(on_event=self.handle_event, timeout=timeout)
+        # a single line has no responses to pair the requests with
+        self.correlator = None if uart is None else Correlator(response_timeout, uart.samplerate)
+        self.stats = DecoderStats()
+        self.stats.attach(self.engine)
+        self.offset = 0
+        self.frames = []
+
+    def reset(self):
+        self.engine.reset()
+        if self.correlator is not None:
+            self.correlator.reset()
+        if self.uart is not None:
+            self.uart.reset()
+        self.stats.reset()
+        self.offset = 0
+
+    def handle_event(self, event, rxtx):
+        if event == EVENT_FRAME:
+            frame = self.engine.frame
+            self.frames.append((frame, [] if self.correlator is None else self.correlator.add(frame)))
+
+    def update(self):
+        size = os.path.getsize(self.path)
+        if size < self.offset:
+            self.reset()
+        if self.uart is not None:
+            import numpy as np
+            dtype = np.dtype('<u{}'.format(self.unitsize))
+            # whole sample words only, a partial one is read by the next update
+            size -= (size - self.offset) % self.unitsize
+        feed = self.engine.feed
+        direction = self.direction
+        self.frames = []
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            offset = self.offset
+            while offset < size:
+                block = f.read(min(READ_SIZE, size - offset))
+                if not block:
+                    break
+                if self.uart is None:
+                    for ss, byte in enumerate(block, offset):
+                        feed(direction, ss, ss, byte)
+                else:
+                    for ss, es, (_, rxtx, (byte, _)) in self.uart.feed(np.frombuffer(block, dtype=dtype)):
+                        feed(rxtx, ss, es, byte)
+                offset += len(block)
+        self.offset = offset
+        return self.frames
+
+    def checkpoint(self):
+        return {
+            'version': CHECKPOINT_VERSION,
+            'direction': self.direction,
+            'offset': self.offset,
+            'engine': self.engine.checkpoint(),
+            'correlator': None if self.correlator is None else self.correlator.checkpoint(),
+            'uart': None if self.uart is None else self.uart.checkpoint(),
+            'stats': self.stats.checkpoint(),
+        }
+
+    def restore(self, checkpoint):
+        if checkpoint.get('version') != CHECKPOINT_VERSION:
+            raise ValueError('Unsupported checkpoint version: {}'.format(checkpoint.get('version')))
+        if (checkpoint['uart'] is None) != (self.uart is None):
+            raise ValueError('Checkpoint of a {} dump'.format('byte' if checkpoint['uart'] is None else 'sample'))
+        if self.uart is None and checkpoint['direction'] != self.direction:
+            raise ValueError('Checkpoint of {} data, not {}'.format(rxtx_channels[checkpoint['direction']],
+                                                                    rxtx_channels[self.direction]))
+        self.engine.restore(checkpoint['engine'])
+        if self.uart is not None:
+            self.uart.restore(checkpoint['uart'])
+            self.correlator.restore(checkpoint['correlator'])
+        self.stats.restore(checkpoint['stats'])
+        self.offset = checkpoint['offset']
+
+    def load(self, path):
+        '''
+        Restore the checkpoint saved in path, if there's one.
+        '''
+        try:
+            with open(path, 'rb') as f:
+                checkpoint = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        self.restore(checkpoint)
+        return True
+
+    def save(self, path):
+        # replaced in one go, an interrupted save leaves the previous one
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.checkpoint(), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('dump', help='raw dump of UART bytes, or of logic samples with --samplerate')
+    parser.add_argument('--direction', choices=rxtx_channels, default='RX', help='direction of byte dumps')
+    parser.add_argument('--samplerate', type=int, help='samplerate of a logic sample dump')
+    parser.add_argument('--rx', type=int, default=0, help='RX bit number of sample dumps')
+    parser.add_argument('--tx', type=int, default=1, help='TX bit number of sample dumps')
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--unitsize', type=int, default=1, help='bytes per sample word of sample dumps')
+    parser.add_argument('--invert', action='store_true', help='inverted (idle low) lines')
+    parser.add_argument('--checkpoint', help='checkpoint file (default <dump>{})'.format(CHECKPOINT_SUFFIX))
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and decode from the start')
+    parser.add_argument('--timeout', type=int, help='max samples between the bytes of a frame (sample dumps)')
+    parser.add_argument('--response-timeout', type=int,
+                        help='max samples between a request and its response (sample dumps)')
+    parser.add_argument('--follow', type=float, metavar='SECONDS', help='poll the dump every SECONDS')
+    parser.add_argument('--stats', action='store_true', help='print the counters of the whole dump')
+    args = parser.parse_args(argv)
+
+    uart = None
+    if args.samplerate is not None:
+        from .uart import UartFrontEnd
+        uart = UartFrontEnd(args.samplerate, args.baudrate, args.rx, args.tx, invert=args.invert)
+    elif args.timeout is not None or args.response_timeout is not None:
+        # the bytes of a byte dump have no timing
+        parser.error('--timeout and --response-timeout require a sample dump (--samplerate)')
+
+    checkpoint_path = args.checkpoint or args.dump + CHECKPOINT_SUFFIX
+    tail = TailDecoder(args.dump, rxtx_channels.index(args.direction), args.timeout, args.response_timeout, uart,
+                       args.unitsize)
+    if not args.restart:
+        try:
+            tail.load(checkpoint_path)
+        except ValueError as e:
+            parser.error('{}: {}'.format(checkpoint_path, e))
+
+    try:
+        while True:
+            for frame, annotations in tail.update():
+                print('{} {} {}'.format(frame.ss, rxtx_channels[frame.rxtx], '; '.join(
+                    texts[0] for _, _, _, texts in frame.annotations + annotations)))
+            tail.save(checkpoint_path)
+            if args.follow is None:
+                break
+            time.sleep(args.follow)
+    except KeyboardInterrupt:
+        pass
+
+    if args.stats:
+        lines = tail.stats.summary()
+        if tail.correlator is not None:
+            lines += tail.correlator.summary()
+        for line in lines:
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+##
+## Copyright (C) 2020 David Lobato <dav.lobato@gmail.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Appliance state changes.
+'''
+
+from .engine import rxtx_channels, ANN_STATE
+
+# fields compared between frames, the ones a record doesn't have are skipped
+TRACKED_FIELDS = ('power', 'mode', 'setpoint', 'fan_speed', 'horizontal_swing', 'vertical_swing',
+                  'indoor_temperature', 'outdoor_temperature', 'error_code')
+
+
+class StateTracker:
+    '''
+    Follows the state decoded from the frames (Frame.state) of each
+    direction and annotates it once per stable period instead of once per
+    frame. A period starts with the first frame of a state and ends with the
+    last frame before one of the tracked fields changes, its annotation names
+    the fields that changed from the previous period.
+
+    add() returns the annotation of the period a frame ends as (ss, es,
+    ann_class, texts) tuples, flush() the ones still open.
+    '''
+
+    def __init__(self, fields=TRACKED_FIELDS):
+        self.fields = fields
+        self.reset()
+
+    def reset(self):
+        # per direction: state, its tracked values, first ss, last es and the changed fields
+        self.periods = [None] * len(rxtx_channels)
+        self.changes = 0
+
+    def add(self, frame):
+        state = frame.state
+        if state is None:
+            return []
+
+        values = tuple(getattr(state, name, None) for name in self.fields)
+        rxtx = frame.rxtx
+        period = self.periods[rxtx]
+        if period is not None and period[1] == values and type(period[0]) is type(state):
+            period[3] = frame.es
+            return []
+
+        annotations = []
+        if period is None:
+            changed = ()
+        else:
+            self.changes += 1
+            annotations.append(self.annotation(rxtx, period))
+            changed = tuple(name for name, old, new in zip(self.fields, period[1], values) if old != new)
+        self.periods[rxtx] = [state, values, frame.ss, frame.es, changed]
+        return annotations
+
+    def flush(self):
+        annotations = [self.annotation(rxtx, period) for rxtx, period in enumerate(self.periods) if period is not None]
+        self.periods = [None] * len(rxtx_channels)
+        return annotations
+
+    def annotation(self, rxtx, period):
+        state, _, ss, es, changed = period
+        spec = state.spec
+        description = ', '.join(spec.by_name[name].format(getattr(state, name)) for name in self.fields
+                                if name in spec.by_name)
+        if changed:
+            changed_str = ', '.join(changed)
+            texts = ['{} ({} changed)'.format(description, changed_str), '{} changed'.format(changed_str), 'State']
+        else:
+            texts = [description, 'State']
+        return ss, es, ANN_STATE + rxtx, texts
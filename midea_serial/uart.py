@@ -0,0 +1,310 @@
+##
+## Copyright (C) 2020 David Lobato <dav.lobato@gmail.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 3 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Offline UART decoding of raw logic samples with NumPy, replacing the stacked
+uart PD when a capture is decoded outside of sigrok:
+
+    python -m midea_serial.uart capture.sr --rx D0 --tx D1 --baudrate 9600
+
+Samples come from the logic chunks of a sigrok session file (.sr) or from a
+raw dump of sample words, one bit per channel. Only 8N1-like frames (no
+parity) are supported, as used by the Midea serial protocol.
+'''
+
+import argparse
+import configparser
+import re
+import zipfile
+import numpy as np
+from .engine import FrameDecoder, RX, TX, EVENT_FRAME
+
+# sigrok samplerate units
+_samplerate_units = {'': 1, 'hz': 1, 'khz': 10 ** 3, 'mhz': 10 ** 6, 'ghz': 10 ** 9}
+
+
+def parse_samplerate(text):
+    match = re.match(r'\s*([0-9.]+)\s*([a-zA-Z]*)\s*$', text)
+    if match is None or match.group(2).lower() not in _samplerate_units:
+        raise ValueError('Invalid samplerate {!r}'.format(text))
+    return int(float(match.group(1)) * _samplerate_units[match.group(2).lower()])
+
+
+class SrCapture:
+    '''
+    A sigrok session file. channels maps the channel names to their bit in
+    the sample words, chunks() yields the logic samples chunk by chunk so a
+    capture never has to fit in memory at once.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with zipfile.ZipFile(path) as zf:
+            metadata = configparser.ConfigParser(interpolation=None)
+            metadata.read_string(zf.read('metadata').decode())
+            names = zf.namelist()
+        device = metadata['device 1']
+        self.samplerate = parse_samplerate(device['samplerate'])
+        self.unitsize = int(device.get('unitsize', '1'))
+        self.channels = {value: int(key[5:]) - 1 for key, value in device.items() if re.match(r'probe\d+$', key)}
+        capturefile = device.get('capturefile', 'logic-1')
+        # logic-1 (version 1) or logic-1-1, logic-1-2... (version 2)
+        chunk_re = re.compile(re.escape(capturefile) + r'(?:-(\d+))?$')
+        self.chunk_names = sorted((name for name in names if chunk_re.match(name)),
+                                  key=lambda name: int(chunk_re.match(name).group(1) or 0))
+
+    def channel(self, name):
+        if name in self.channels:
+            return self.channels[name]
+        return int(name)
+
+    def chunks(self):
+        dtype = np.dtype('<u{}'.format(self.unitsize))
+        with zipfile.ZipFile(self.path) as zf:
+            for name in self.chunk_names:
+                yield np.frombuffer(zf.read(name), dtype=dtype)
+
+
+def raw_chunks(path, unitsize=1, chunk_size=1 << 24):
+    '''
+    Memory map a raw dump of little endian sample words and yield it in
+    chunks of chunk_size samples.
+    '''
+    samples = np.memmap(path, dtype=np.dtype('<u{}'.format(unitsize)), mode='r')
+    for start in range(0, len(samples), chunk_size):
+        yield samples[start:start + chunk_size]
+
+
+class _Channel:
+    __slots__ = ('rxtx', 'bit', 'line', 'base', 'pos', 'pending', 'frame_errors')
+
+    def __init__(self, rxtx, bit):
+        self.rxtx = rxtx  # bus * 2 + direction
+        self.bit = bit
+        self.reset()
+
+    def reset(self):
+        self.line = np.ones(1, dtype=np.uint8)  # samples not decoded yet, idle before the capture
+        self.base = -1  # sample number of line[0]
+        self.pos = 0  # start bit edges are looked for after line[pos]
+        self.pending = None  # decoded bytes not returned yet
+        self.frame_errors = 0
+
+
+class UartFrontEnd:
+    '''
+    Decodes the RX and TX lines (bit numbers rx and tx of the sample words,
+    None to skip one) into the (ss, es, ('DATA', rxtx, (byte, bits)))
+    packets the stacked uart PD gives to Decoder.decode(), in start sample
+    order. bits is the list of [bit, ss, es] data bits when with_bits is
+    set, empty otherwise.
+
+    buses lists the (rx, tx) bit numbers of several bus pairs to decode in
+    one pass instead of rx and tx, the rxtx of the packets is then
+    bus * 2 + direction.
+
+    Start bit edges are found with NumPy and the bit centers of all the
+    bytes in a chunk are sampled at once. Like the uart PD, a byte with an
+    invalid stop bit is still returned and counted in frame_errors.
+    '''
+
+    def __init__(self, samplerate, baudrate=9600, rx=0, tx=1, data_bits=8, stop_bits=1, invert=False,
+                 with_bits=False, buses=None):
+        self.samplerate = samplerate
+        self.baudrate = baudrate
+        self.data_bits = data_bits
+        self.stop_bits = stop_bits
+        self.invert = invert
+        self.with_bits = with_bits
+        self.bit_width = samplerate / baudrate
+        frame_bits = 1 + data_bits + stop_bits
+        # bit centers from the start bit edge
+        self.centers = np.round((np.arange(frame_bits) + 0.5) * self.bit_width).astype(np.int64)
+        self.bit_starts = np.round(np.arange(frame_bits + 1) * self.bit_width).astype(np.int64)
+        self.weights = 1 << np.arange(data_bits)
+        if buses is None:
+            buses = [(rx, tx)]
+        self.channels = [_Channel(bus * 2 + rxtx, bit) for bus, pair in enumerate(buses)
+                         for rxtx, bit in zip((RX, TX), pair) if bit is not None]
+
+    @property
+    def frame_errors(self):
+        return {channel.rxtx: channel.frame_errors for channel in self.channels}
+
+    def reset(self):
+        for channel in self.channels:
+            channel.reset()
+
+    def checkpoint(self):
+        '''
+        The samples of the bytes being received and the decoded bytes not
+        returned yet of every line, restore() continues from them.
+        '''
+        return {
+            'channels': [(channel.line.copy(), channel.base, channel.pos,
+                          None if channel.pending is None else [array.copy() for array in channel.pending],
+                          channel.frame_errors) for channel in self.channels],
+        }
+
+    def restore(self, checkpoint):
+        if len(checkpoint['channels']) != len(self.channels):
+            raise ValueError('Checkpoint of {} lines, not {}'.format(len(checkpoint['channels']), len(self.channels)))
+        for channel, (line, base, pos, pending, frame_errors) in zip(self.channels, checkpoint['channels']):
+            channel.line = line.copy()
+            channel.base = base
+            channel.pos = pos
+            channel.pending = None if pending is None else [array.copy() for array in pending]
+            channel.frame_errors = frame_errors
+
+    def decode(self, chunks):
+        for chunk in chunks:
+            yield from self.feed(chunk)
+        yield from self.flush()
+
+    def feed(self, samples):
+        samples = np.asarray(samples)
+        for channel in self.channels:
+            line = ((samples >> channel.bit) & 1).astype(np.uint8)
+            if self.invert:
+                line ^= 1
+            self.decode_channel(channel, np.concatenate((channel.line, line)))
+        # a byte can't be returned before the bytes other channels are still receiving
+        horizon = min(channel.base + channel.pos for channel in self.channels)
+        return self.merge(horizon)
+
+    def flush(self):
+        return self.merge(None)
+
+    def decode_channel(self, channel, line):
+        centers = self.centers
+        stop_center = int(centers[-1])
+        start_center = int(centers[0])
+        n = len(line)
+
+        # index of the first low sample of every falling edge
+        edges = np.flatnonzero(line[:-1] > line[1:]) + 1
+        starts = []
+        pos = channel.pos
+        i = int(np.searchsorted(edges, pos + 1))
+        while i < len(edges):
+            edge = int(edges[i])
+            if edge + stop_center >= n:
+                # incomplete byte, decoded with the next chunk
+                pos = edge - 1
+                break
+            if line[edge + start_center]:
+                # glitch, the start bit isn't low in its center
+                i += 1
+                continue
+            starts.append(edge)
+            # the next start bit is looked for after the stop bit center
+            pos = edge + stop_center
+            i = int(np.searchsorted(edges, pos + 1))
+        else:
+            pos = max(pos, n - 1)
+
+        if starts:
+            starts = np.array(starts, dtype=np.int64)
+            bits = line[starts[:, None] + centers]
+            data_bits = bits[:, 1:1 + self.data_bits]
+            decoded = [starts + channel.base, data_bits.dot(self.weights), bits[:, 1 + self.data_bits:].all(axis=1)]
+            if self.with_bits:
+                decoded.append(data_bits)
+            channel.frame_errors += int(len(starts) - np.count_nonzero(decoded[2]))
+            if channel.pending is not None:
+                decoded = [np.concatenate((old, new)) for old, new in zip(channel.pending, decoded)]
+            channel.pending = decoded
+
+        # keep the samples from pos on, line[pos] is needed to see an edge at pos + 1
+        channel.line = line[pos:].copy()
+        channel.base += pos
+        channel.pos = 0
+
+    def merge(self, horizon):
+        starts, values, rxtx, bits = [], [], [], []
+        for channel in self.channels:
+            pending = channel.pending
+            if pending is None:
+                continue
+            if horizon is None:
+                count = len(pending[0])
+            else:
+                count = int(np.searchsorted(pending[0], horizon))
+            if count == 0:
+                continue
+            starts.append(pending[0][:count])
+            values.append(pending[1][:count])
+            rxtx.append(np.full(count, channel.rxtx, dtype=np.uint8))
+            if self.with_bits:
+                bits.append(pending[3][:count])
+            channel.pending = None if count == len(pending[0]) else [array[count:] for array in pending]
+
+        if not starts:
+            return []
+        starts = np.concatenate(starts)
+        order = np.argsort(starts, kind='stable')
+        starts = starts[order]
+        ss = (starts + self.bit_starts[1]).tolist()
+        es = (starts + self.bit_starts[1 + self.data_bits]).tolist()
+        values = np.concatenate(values)[order].tolist()
+        rxtx = np.concatenate(rxtx)[order].tolist()
+        if not self.with_bits:
+            return [(ss[i], es[i], ('DATA', rxtx[i], (values[i], []))) for i in range(len(ss))]
+
+        bits = np.concatenate(bits)[order].tolist()
+        bit_ss = self.bit_starts[1:1 + self.data_bits].tolist()
+        bit_es = self.bit_starts[2:2 + self.data_bits].tolist()
+        return [(ss[i], es[i], ('DATA', rxtx[i], (values[i], [[bit, starts_i + s, starts_i + e] for bit, s, e in
+                                                              zip(bits[i], bit_ss, bit_es)])))
+                for i, starts_i in enumerate(starts.tolist())]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('capture', help='.sr session file or raw sample dump')
+    parser.add_argument('--rx', default='0', help='RX channel name or bit number')
+    parser.add_argument('--tx', default='1', help='TX channel name or bit number')
+    parser.add_argument('--baudrate', type=int, default=9600)
+    parser.add_argument('--samplerate', type=int, help='samplerate of a raw dump')
+    parser.add_argument('--unitsize', type=int, default=1, help='bytes per sample word of a raw dump')
+    parser.add_argument('--invert', action='store_true', help='inverted (idle low) lines')
+    args = parser.parse_args(argv)
+
+    if zipfile.is_zipfile(args.capture):
+        capture = SrCapture(args.capture)
+        samplerate, chunks = capture.samplerate, capture.chunks()
+        rx, tx = capture.channel(args.rx), capture.channel(args.tx)
+    else:
+        if args.samplerate is None:
+            parser.error('--samplerate is required for raw dumps')
+        samplerate, chunks = args.samplerate, raw_chunks(args.capture, args.unitsize)
+        rx, tx = int(args.rx), int(args.tx)
+
+    uart = UartFrontEnd(samplerate, args.baudrate, rx, tx, invert=args.invert)
+    engine = FrameDecoder()
+    feed = engine.feed
+    frames = []
+    engine.on_event = lambda event, rxtx: frames.append(engine.frame) if event == EVENT_FRAME else None
+    for ss, es, (_, rxtx, (byte, _)) in uart.decode(chunks):
+        feed(rxtx, ss, es, byte)
+        for frame in frames:
+            print('{} {}'.format(frame.ss, '; '.join(texts[0] for _, _, _, texts in frame.annotations)))
+        frames.clear()
+
+
+if __name__ == '__main__':
+    main()
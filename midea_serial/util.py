@@ -38,15 +38,86 @@ crc8_854_table = [
 
 def crc8(data):
     crc_value = 0
+    table = crc8_854_table
     for m in data:
-        k = crc_value ^ m
-        if k > 256:
-            k -= 256
-        if k < 0:
-            k += 256
-        crc_value = crc8_854_table[k]
+        crc_value = table[crc_value ^ m]
     return crc_value
 
 
 def checksum(data):
-    return (~ sum(data) + 1) & 0xff
\ No newline at end of file
+    return (~ sum(data) + 1) & 0xff
+
+
+def _numpy():
+    # NumPy is optional and only imported by the batch functions, so loading
+    # the PD doesn't pay for it
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def pack_frames(frames, right_align=False):
+    '''
+    Pack a sequence of byte strings into a zero padded 2-D uint8 array, one
+    frame per row. Returns the array and the frame lengths. Requires NumPy.
+    '''
+    np = _numpy()
+    if np is None:
+        raise ImportError('pack_frames requires NumPy')
+    frames = [bytes(frame) for frame in frames]
+    lengths = np.fromiter(map(len, frames), dtype=np.intp, count=len(frames))
+    width = int(lengths.max()) if len(frames) else 0
+    packed = np.zeros((len(frames), width), dtype=np.uint8)
+    flat = np.frombuffer(b''.join(frames), dtype=np.uint8)
+    starts = np.cumsum(lengths) - lengths
+    rows = np.repeat(np.arange(len(frames)), lengths)
+    cols = np.arange(flat.size) - np.repeat(starts, lengths)
+    if right_align:
+        cols += np.repeat(width - lengths, lengths)
+    packed[rows, cols] = flat
+    return packed, lengths
+
+
+def checksum_batch(frames):
+    '''
+    checksum() of many frames at once. Returns the checksums and a mask of the
+    frames that validate, i.e. whose checksum including the trailing checksum
+    byte is 0. Uses NumPy when available, lists otherwise.
+    '''
+    np = _numpy()
+    if np is None:
+        values = [checksum(frame) for frame in frames]
+        return values, [value == 0 for value in values]
+
+    # zero padding doesn't change the sum
+    packed, _ = pack_frames(frames)
+    values = (-packed.sum(axis=1, dtype=np.int64) & 0xff).astype(np.uint8)
+    return values, values == 0
+
+
+def crc8_batch(frames, expected=None):
+    '''
+    crc8() of many frames at once. Returns the CRCs and a mask of the frames
+    matching expected, or of the frames that validate with their trailing CRC
+    byte included (CRC 0) if expected isn't given. Uses NumPy when
+    available, lists otherwise.
+    '''
+    np = _numpy()
+    if np is None:
+        values = [crc8(frame) for frame in frames]
+        if expected is None:
+            return values, [value == 0 for value in values]
+        return values, [value == crc for value, crc in zip(values, expected)]
+
+    # leading zeros don't change the CRC (table[0] == 0), so right aligning the
+    # frames lets the whole batch go through the table one column at a time
+    packed, _ = pack_frames(frames, right_align=True)
+    table = np.array(crc8_854_table, dtype=np.uint8)
+    values = np.zeros(packed.shape[0], dtype=np.uint8)
+    for column in packed.T:
+        values = table[values ^ column]
+    if expected is None:
+        return values, values == 0
+    return values, values == np.asarray(expected, dtype=np.uint8)
@@ -0,0 +1,44 @@
+from midea_serial.ac import decode_ac_control
+from midea_serial.encoder import encode_ac_control, encode_ac_status, encode_frame
+from midea_serial.engine import FrameDecoder, RX, TX
+
+
+def annotation(body, rxtx):
+    frame, = FrameDecoder().decode(encode_frame(0x02, body), rxtx)
+    return frame.annotations[0][3][0], frame.state
+
+
+def test_swing_wording():
+    # the annotation texts are matched by users' scripts, keep their wording
+    text, state = annotation(encode_ac_control(horizontal_swing=True, vertical_swing=False), TX)
+    assert text.startswith('Control command[0]: ')
+    assert ', swing=horizontal on,vertical off' in text
+    assert state.horizontal_swing and not state.vertical_swing
+
+    text, state = annotation(encode_ac_status(horizontal_swing=False, vertical_swing=True), RX)
+    assert text.startswith('Response[0]: ')
+    assert ', swing=horizontal off,vertical on, indoor T=' in text
+    assert not state.horizontal_swing and state.vertical_swing
+
+
+def test_decode_cache():
+    decode_ac_control.cache_clear()
+    error, texts, state = decode_ac_control(True, encode_ac_control(msg_id=1, setpoint=22.0))
+    assert not error and texts[0].startswith('Control command[1]: ')
+    assert decode_ac_control.cache_info()[:2] == (0, 1)
+
+    # the next polls only differ in their msg id and CRC8
+    for msg_id in range(2, 5):
+        error, texts, repeated = decode_ac_control(True, encode_ac_control(msg_id=msg_id, setpoint=22.0))
+        assert not error and texts[0] == 'Control command[{}]: '.format(msg_id) + texts[0].split(': ', 1)[1]
+        assert repeated == state
+    assert decode_ac_control.cache_info()[:2] == (3, 1)
+
+    # a field change is decoded again, a CRC8 failure isn't cached apart
+    error, texts, changed = decode_ac_control(True, encode_ac_control(msg_id=5, setpoint=23.0))
+    assert not error and changed.setpoint == 23.0
+    assert decode_ac_control.cache_info()[:2] == (3, 2)
+    body = bytearray(encode_ac_control(msg_id=6, setpoint=22.0))
+    body[-1] ^= 0xFF
+    assert decode_ac_control(True, bytes(body)) == (True, ['CRC8 failed'], None)
+    assert decode_ac_control.cache_info()[:2] == (4, 2)
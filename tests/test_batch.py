@@ -0,0 +1,22 @@
+import os
+from midea_serial.batch import expand
+
+
+def write(path, size):
+    with open(path, 'wb') as f:
+        f.write(bytes(size))
+    return str(path)
+
+
+def test_expand(tmp_path):
+    small = write(tmp_path / 'small.sr', 10)
+    big = write(tmp_path / 'big.BIN', 20)
+    for name in ('big.BIN.midx', 'big.BIN.frames', 'small.sr.ckpt', 'notes.txt'):
+        write(tmp_path / name, 30)
+    os.mkdir(tmp_path / 'sub.sr')
+    other = write(tmp_path / 'other.dump', 5)
+
+    assert expand([str(tmp_path)]) == [big, small]
+    # explicit files and patterns aren't filtered, duplicates are dropped
+    assert expand([str(tmp_path), other, str(tmp_path / '*.sr')]) == [big, small, other]
+    assert expand([str(tmp_path)], ('.dump',)) == [other]
@@ -0,0 +1,34 @@
+from midea_serial.correlator import Correlator, format_latency
+from midea_serial.encoder import encode_frame
+from midea_serial.engine import FrameDecoder, ANN_ERROR, ANN_EXCHANGE, RX, TX
+
+
+def decode(correlator, frames):
+    engine = FrameDecoder()
+    annotations = []
+    for rxtx, data in frames:
+        for frame in engine.decode(data, rxtx):
+            annotations += correlator.add(frame)
+    return annotations
+
+
+def test_pending_requests_at_end_are_unanswered():
+    correlator = Correlator()
+    annotations = decode(correlator, [(TX, encode_frame(0x13, msg_id=1)), (RX, encode_frame(0x13, msg_id=1)),
+                                      (TX, encode_frame(0x13, msg_id=2))])
+    assert [ann_class for _, _, ann_class, _ in annotations] == [ANN_EXCHANGE]
+    summary = correlator.summary()
+    assert len(summary) == 1
+    assert summary[0].startswith('0x13: 1 responses') and summary[0].endswith(', 1 unanswered, 0 unsolicited')
+
+    annotations = correlator.flush()
+    assert [(ann_class, texts[0]) for _, _, ann_class, texts in annotations] == \
+           [(ANN_ERROR, 'Request 0x13 not answered')]
+    assert correlator.unanswered == {0x13: 1}
+    assert correlator.summary() == summary
+    assert correlator.flush() == []
+
+
+def test_format_latency():
+    assert format_latency(250, None) == '250 samples'
+    assert format_latency(250, 1000000) == '250 samples (0.250 ms)'
@@ -0,0 +1,54 @@
+import os
+import random
+import subprocess
+import sys
+import pytest
+from midea_serial.encoder import (CORRUPTIONS, corrupt, encode_ac_status, encode_frame, encode_network_status,
+                                  generate_traffic)
+from midea_serial.engine import FrameDecoder, ANN_CMD, ANN_ERROR, RX, TX
+
+
+def test_short_network_status_response():
+    frames = list(FrameDecoder().decode(encode_frame(0x63, b'\x01'), TX))
+    assert len(frames) == 1 and frames[0].checksum_ok
+    assert [ann_class for _, _, ann_class, _ in frames[0].annotations] == [ANN_ERROR]
+
+    frames = list(FrameDecoder().decode(encode_frame(0x63, encode_network_status()), TX))
+    assert [ann_class for _, _, ann_class, _ in frames[0].annotations] == [ANN_CMD + TX]
+
+
+@pytest.mark.parametrize('kind', CORRUPTIONS)
+def test_glitch_costs_at_most_one_frame(kind):
+    rng = random.Random(kind)
+    frames = [frame for rxtx, frame in generate_traffic(200, seed=1) if rxtx == RX]
+    for _ in range(50):
+        bad = rng.randrange(len(frames) - 1)
+        data = b''.join(frames[:bad]) + corrupt(frames[bad], kind, rng) + b''.join(frames[bad + 1:])
+        engine = FrameDecoder()
+        decoded = [b'\xaa' + frame.data for frame in engine.decode(data, RX) if frame.checksum_ok]
+        # every other frame is decoded, in order
+        expected = frames[:bad] + frames[bad + 1:]
+        position = 0
+        for frame in expected:
+            assert frame in decoded[position:], (kind, bad)
+            position = decoded.index(frame, position) + 1
+
+
+LAZY_LOAD_SCRIPT = """
+import sys
+from midea_serial import correlator, engine, index, stats, tracker
+assert 'midea_serial.ac' not in sys.modules
+frames = list(engine.FrameDecoder().decode(bytes.fromhex(sys.argv[1]), engine.RX))
+assert 'midea_serial.ac' in sys.modules
+print(frames[0].annotations[0][3][0])
+"""
+
+
+def test_appliance_module_loaded_on_first_frame():
+    # the encoder imports the AC module, so the check runs in a fresh interpreter
+    data = encode_frame(0x02, encode_ac_status(setpoint=21.0))
+    (frame,) = FrameDecoder().decode(data, RX)
+    result = subprocess.run([sys.executable, '-c', LAZY_LOAD_SCRIPT, data.hex()], capture_output=True, text=True,
+                            check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert result.stdout.strip() == frame.annotations[0][3][0]
+    assert 'setpoint=21.00' in result.stdout
@@ -0,0 +1,68 @@
+import csv
+import math
+import pytest
+from midea_serial.ac import AC_CONTROL, AC_STATUS
+from midea_serial.encoder import generate_traffic
+from midea_serial.engine import FrameDecoder
+from midea_serial.export import COLUMNS, STATE_COLUMNS, FrameExporter
+
+
+def decode_traffic():
+    frames = []
+    for rxtx, data in generate_traffic(40, seed=3):
+        frames.extend(FrameDecoder().decode(data, rxtx))
+    assert any(frame.state is not None for frame in frames) and any(frame.state is None for frame in frames)
+    return frames
+
+
+def expected_rows(frames):
+    rows = []
+    for frame in frames:
+        row = [frame.ss, frame.es, frame.rxtx, frame.msg_type, frame.appliance_type, frame.msg_id,
+               int(frame.checksum_ok)]
+        for name, _, missing in STATE_COLUMNS:
+            value = getattr(frame.state, name, None)
+            row.append(missing if value is None else value)
+        rows.append(row)
+    return rows
+
+
+def without_nan(rows):
+    # NaN != NaN
+    return [[None if isinstance(value, float) and math.isnan(value) else value for value in row] for row in rows]
+
+
+def test_state_columns():
+    # every field of the AC bodies gets a column
+    names = [name for name, _, _ in STATE_COLUMNS]
+    assert set(names) == set(AC_CONTROL.by_name) | set(AC_STATUS.by_name)
+    assert len(names) == len(set(names))
+    assert dict((name, typecode) for name, typecode, _ in STATE_COLUMNS)['setpoint'] == 'd'
+
+
+def test_csv_round_trip(tmp_path):
+    frames = decode_traffic()
+    path = str(tmp_path / 'frames.csv')
+    with FrameExporter(path, chunk_size=7) as exporter:
+        for frame in frames:
+            exporter.add(frame)
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        assert next(reader) == [name for name, _, _ in COLUMNS]
+        rows = [[float(value) if typecode == 'd' else int(value) for (_, typecode, _), value in zip(COLUMNS, row)]
+                for row in reader]
+    assert without_nan(rows) == without_nan(expected_rows(frames))
+
+
+def test_npz_round_trip(tmp_path):
+    np = pytest.importorskip('numpy')
+    frames = decode_traffic()
+    path = str(tmp_path / 'frames.npz')
+    with FrameExporter(path, chunk_size=7) as exporter:
+        for frame in frames:
+            exporter.add(frame)
+    with np.load(path) as data:
+        assert sorted(data.files) == sorted(name for name, _, _ in COLUMNS)
+        assert data['ss'].dtype == np.int64 and data['setpoint'].dtype == np.float64
+        rows = [list(row) for row in zip(*(data[name].tolist() for name, _, _ in COLUMNS))]
+    assert without_nan(rows) == without_nan(expected_rows(frames))
@@ -0,0 +1,60 @@
+import random
+import pytest
+from midea_serial import index as index_module
+from midea_serial.encoder import encode_frame
+from midea_serial.engine import FrameDecoder, EVENT_FRAME, RX, TX
+from midea_serial.index import FrameIndex, FrameIndexWriter, build, index_path
+
+
+@pytest.fixture
+def dump(tmp_path):
+    # every 5th frame claims the maximum length, it swallows the next ones,
+    # which are recovered by the resync after their bad frame is reported
+    rng = random.Random(1)
+    data = bytearray()
+    for i in range(50):
+        frame = bytearray(encode_frame(rng.choice((0x03, 0x04, 0x63)), bytes(rng.randrange(1, 20)), msg_id=i))
+        if i % 5 == 0:
+            frame[1] = 0xFF
+        data += frame
+    path = tmp_path / 'rx.bin'
+    path.write_bytes(bytes(data))
+    return str(path)
+
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_records_sorted_after_resync(dump, monkeypatch, numpy):
+    if numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(index_module, '_numpy', lambda: None)
+    count = build(dump)
+    index = FrameIndex(index_path(dump))
+    assert len(index) == count
+    records = [index.record(row) for row in range(count)]
+    assert any(not record.flags & index_module.FLAG_CHECKSUM_OK for record in records)
+    assert [(record.ss, record.es) for record in records] == sorted((record.ss, record.es) for record in records)
+
+    for start, end in ((100, 400), (0, 50), (None, 300), (250, None), (None, None)):
+        expected = [row for row, record in enumerate(records)
+                    if (start is None or record.es >= start) and (end is None or record.es <= end)]
+        assert list(index.query(start=start, end=end)) == expected
+    rows = index.query(msg_type=0x63, errors=False)
+    assert all(frame[9] == 0x63 for frame in index.raw(rows))
+
+
+def test_records_sorted_across_directions(tmp_path):
+    # a short TX frame sent while a long RX one is received completes first
+    path = str(tmp_path / 'capture.midx')
+    engine = FrameDecoder()
+    with FrameIndexWriter(path) as writer:
+        engine.on_event = lambda event, rxtx: writer.add(engine.frame) if event == EVENT_FRAME else None
+        rx = encode_frame(0x04, bytes(40))
+        tx = encode_frame(0x03, bytes(2))
+        for i, byte in enumerate(rx):
+            engine.feed(RX, i * 10, i * 10 + 9, byte)
+            if i < len(tx):
+                engine.feed(TX, i * 10 + 5, i * 10 + 14, tx[i])
+    index = FrameIndex(path)
+    assert [index.record(row).direction for row in range(len(index))] == [RX, TX]
+    assert list(index.query(direction=TX, start=0, end=200)) == [1]
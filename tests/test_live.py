@@ -0,0 +1,56 @@
+import asyncio
+import pytest
+
+live = pytest.importorskip('midea_serial.live')  # POSIX only
+
+
+async def run_bus(count, queue_size, consumer_delay, seed=7):
+    emulator = live.BusEmulator(count, seed=seed, baudrate=115200, gap=0.001)
+    decoder = live.LiveDecoder(queue_size=queue_size)
+    received = []
+
+    async def consume():
+        async for frame in decoder.frames():
+            received.append(frame)
+            await asyncio.sleep(consumer_delay)
+
+    try:
+        decoder.open(emulator.rx_path, live.RX, 115200)
+        decoder.open(emulator.tx_path, live.TX, 115200)
+        consumer = asyncio.ensure_future(consume())
+        await emulator.run()
+        # let the last bytes arrive and the consumer catch up
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            if len(received) + decoder.dropped_frames + decoder.queue.qsize() >= len(emulator.sent):
+                break
+        await asyncio.sleep(0.05 + consumer_delay * 2)
+        consumer.cancel()
+    finally:
+        decoder.close()
+        emulator.close()
+    return emulator, decoder, received
+
+
+def test_frames_match_sent():
+    emulator, decoder, received = asyncio.run(run_bus(30, 1024, 0))
+    assert decoder.dropped_frames == 0
+    assert [(frame.rxtx, b'\xaa' + frame.data) for frame in received] == \
+           [(rxtx, frame) for _, rxtx, frame in emulator.sent]
+    assert all(frame.checksum_ok for frame in received)
+    assert decoder.bytes_read == sum(len(frame) for _, _, frame in emulator.sent)
+
+
+def test_slow_consumer_drops_frames_not_bytes():
+    emulator, decoder, received = asyncio.run(run_bus(30, 1, 0.05))
+    assert decoder.dropped_frames > 0
+    # every byte was read and decoded, frames only went missing from the queue
+    assert decoder.bytes_read == sum(len(frame) for _, _, frame in emulator.sent)
+    assert len(received) + decoder.dropped_frames == len(emulator.sent)
+    assert decoder.engine.dropped_bytes == 0 and decoder.engine.resyncs == 0
+    sent = [(rxtx, frame) for _, rxtx, frame in emulator.sent]
+    received = [(frame.rxtx, b'\xaa' + frame.data) for frame in received]
+    # the frames that got through are sent ones, in order
+    position = 0
+    for item in received:
+        position = sent.index(item, position) + 1
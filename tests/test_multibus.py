@@ -0,0 +1,35 @@
+import itertools
+from midea_serial.encoder import corrupt, encode_frame
+from midea_serial.engine import RX, TX
+from midea_serial.multibus import MultiBusDecoder
+
+
+def interleave(*lines):
+    # (line, frames) streams, one byte of each line in turn
+    streams = [[(line, byte) for frame in frames for byte in frame] for line, frames in lines]
+    items = [item for items in itertools.zip_longest(*streams) for item in items if item is not None]
+    return [(ss, ss + 1, ('DATA', line, (byte, []))) for ss, (line, byte) in enumerate(items)]
+
+
+def test_buses_are_separate():
+    ac1 = [encode_frame(0x41, bytes(6), msg_id=1), encode_frame(0x41, bytes(6), msg_id=2)]
+    ac2_rx = [encode_frame(0x63, bytes(20), msg_id=3), corrupt(encode_frame(0x63, bytes(20)), 'checksum')]
+    ac2_tx = [encode_frame(0x0D, msg_id=4)]
+    packets = interleave((0 * 2 + TX, ac1), (1 * 2 + RX, ac2_rx), (1 * 2 + TX, ac2_tx))
+
+    decoder = MultiBusDecoder(['ac1', 'ac2'], stats=True)
+    frames = [(bus.name, frame.rxtx, frame.data) for bus, frame in decoder.decode(packets)]
+    # frames with a bad checksum are reported too
+    assert [frame for frame in frames if frame[0] == 'ac1'] == [('ac1', TX, frame[1:]) for frame in ac1]
+    assert [frame for frame in frames if frame[0] == 'ac2'] == \
+           [('ac2', TX, ac2_tx[0][1:])] + [('ac2', RX, frame[1:]) for frame in ac2_rx]
+
+    stats = decoder.as_dict()
+    ac1_stats, ac2_stats = stats['buses']['ac1'], stats['buses']['ac2']
+    assert ac1_stats['frames'] == {'RX': {}, 'TX': {'0x41': 2}}
+    assert ac2_stats['frames'] == {'RX': {'0x63': 2}, 'TX': {'0x0D': 1}}
+    assert (ac1_stats['checksum_failures'], ac2_stats['checksum_failures']) == (0, 1)
+    assert sum(ac1_stats['bytes']['RX'].values()) == 0
+    assert sum(ac1_stats['bytes']['TX'].values()) == sum(map(len, ac1))
+    assert stats['total']['frames'] == {'RX': {'0x63': 2}, 'TX': {'0x0D': 1, '0x41': 2}}
+    assert stats['total']['checksum_failures'] == 1
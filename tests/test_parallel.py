@@ -0,0 +1,54 @@
+import random
+import pytest
+from midea_serial.encoder import generate_traffic
+from midea_serial.engine import FrameDecoder, RX
+from midea_serial.parallel import decode_parallel
+
+
+def make_dump(path, count, seed, corrupt_rate=0.1):
+    # frames of both directions with corrupted ones and line noise
+    rng = random.Random(seed)
+    data = bytearray()
+    for _, frame in generate_traffic(count, seed, corrupt_rate):
+        data += frame
+        if rng.random() < 0.05:
+            data += bytes(rng.choice((0xAA, rng.randrange(0x100))) for _ in range(rng.randrange(1, 30)))
+    with open(path, 'wb') as f:
+        f.write(data)
+    return bytes(data)
+
+
+def key(frame):
+    return (frame.rxtx, frame.data, frame.ss, frame.es_sync, frame.ss_header, frame.es_header, frame.ss_msg,
+            frame.es, frame.checksum_ok, frame.annotations, frame.state)
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_chunks_match_serial(tmp_path, seed):
+    path = str(tmp_path / 'rx.bin')
+    data = make_dump(path, 300, seed)
+    frames = list(FrameDecoder().decode(data, RX))
+    expected = [key(frame) for frame in frames]
+    for chunks in (1, 2, 7, 50, 333):
+        assert [key(frame) for frame in decode_parallel(path, RX, processes=1, chunks=chunks,
+                                                        annotate=True)] == expected
+
+    # without annotate only the frames are built
+    for frame in frames:
+        frame.annotations = []
+        frame.state = None
+    assert [key(frame) for frame in decode_parallel(path, RX, processes=1, chunks=7)] == \
+           [key(frame) for frame in frames]
+
+
+def test_process_pool_matches_serial(tmp_path):
+    path = str(tmp_path / 'rx.bin')
+    data = make_dump(path, 1000, 42)
+    expected = [key(frame) for frame in FrameDecoder().decode(data, RX)]
+    assert [key(frame) for frame in decode_parallel(path, RX, processes=2, chunks=8, annotate=True)] == expected
+
+
+def test_empty(tmp_path):
+    path = str(tmp_path / 'rx.bin')
+    open(path, 'wb').close()
+    assert list(decode_parallel(path, processes=1)) == []
@@ -0,0 +1,49 @@
+from midea_serial.encoder import generate_traffic
+from midea_serial.engine import FrameDecoder
+from midea_serial.stats import DecoderStats
+
+
+def run(engine, traffic):
+    for rxtx, frame in traffic:
+        for _ in engine.decode(frame, rxtx):
+            pass
+
+
+def counters(stats):
+    result = stats.as_dict()
+    del result['handlers']
+    return result
+
+
+def test_reset_keeps_counting():
+    traffic = list(generate_traffic(200, seed=3, corrupt_rate=0.1))
+    engine = FrameDecoder()
+    stats = DecoderStats()
+    stats.attach(engine)
+    run(engine, traffic)
+    first = counters(stats)
+    calls = {spec: timing[0] for spec, timing in stats.handlers.items()}
+    assert sum(sum(frames.values()) for frames in first['frames'].values())
+
+    engine.reset()
+    stats.reset()
+    assert stats.frames == {} and stats.handlers == {} and stats.checksum_failures == 0
+    run(engine, traffic)
+    assert counters(stats) == first
+    assert {spec: timing[0] for spec, timing in stats.handlers.items()} == calls
+
+
+def test_checkpoint_restore():
+    traffic = list(generate_traffic(100, seed=4, corrupt_rate=0.1))
+    engine = FrameDecoder()
+    stats = DecoderStats()
+    stats.attach(engine)
+    run(engine, traffic[:60])
+    checkpoint = stats.checkpoint(), engine.checkpoint()
+    run(engine, traffic[60:])
+    expected = counters(stats)
+
+    stats.restore(checkpoint[0])
+    engine.restore(checkpoint[1])
+    run(engine, traffic[60:])
+    assert counters(stats) == expected
@@ -0,0 +1,103 @@
+import random
+import pytest
+from midea_serial.encoder import generate_traffic
+from midea_serial.engine import FrameDecoder, RX
+from midea_serial.stats import DecoderStats
+from midea_serial.tail import TailDecoder
+
+SAMPLERATE = 200000
+BAUDRATE = 9600
+
+
+def key(frame, annotations):
+    return frame.rxtx, frame.ss, frame.es, bytes(frame.data), frame.annotations, annotations
+
+
+def counters(tail):
+    stats = tail.stats.as_dict()
+    del stats['handlers']
+    return stats
+
+
+def append_and_update(path, data, bounds, restart):
+    # append data to path in pieces, updating after each, with a new
+    # TailDecoder resuming from the checkpoint if restart
+    open(path, 'wb').close()
+    checkpoint = path + '.ckpt'
+    tail = make_tail(path)
+    frames = []
+    for start, end in zip([0] + bounds, bounds + [len(data)]):
+        if restart:
+            tail = make_tail(path)
+            tail.load(checkpoint)
+        with open(path, 'ab') as f:
+            f.write(data[start:end])
+        frames += [key(*item) for item in tail.update()]
+        tail.save(checkpoint)
+    return frames, tail
+
+
+def make_tail(path):
+    if path.endswith('.samples'):
+        from midea_serial.uart import UartFrontEnd
+        return TailDecoder(path, timeout=SAMPLERATE // 100, response_timeout=SAMPLERATE // 10,
+                           uart=UartFrontEnd(SAMPLERATE, BAUDRATE), unitsize=2)
+    return TailDecoder(path, RX)
+
+
+def random_bounds(rng, size, count=15):
+    return sorted(rng.sample(range(1, size), count))
+
+
+@pytest.mark.parametrize('restart', [False, True])
+def test_byte_dump(tmp_path, restart):
+    rng = random.Random(7)
+    data = b''.join(frame for rxtx, frame in generate_traffic(60, seed=7, corrupt_rate=0.1) if rxtx == RX)
+    path = str(tmp_path / 'rx.bin')
+    frames, tail = append_and_update(path, data, random_bounds(rng, len(data)), restart)
+
+    engine = FrameDecoder()
+    stats = DecoderStats()
+    stats.attach(engine)
+    assert frames == [key(frame, []) for frame in engine.decode(data, RX)]
+    assert tail.correlator is None
+    assert tail.offset == len(data)
+    expected = stats.as_dict()
+    del expected['handlers']
+    assert counters(tail) == expected
+
+
+def waveform(seed):
+    # the exchanges one after another, both lines in 16 bit sample words
+    np = pytest.importorskip('numpy')
+    rng = random.Random(seed)
+    bit_width = SAMPLERATE / BAUDRATE
+    events = []
+    t = 100.0
+    for rxtx, frame in generate_traffic(30, seed=seed, corrupt_rate=0.1):
+        for byte in frame:
+            events.append((int(round(t)), rxtx, byte))
+            t += bit_width * (10 + rng.random())
+        t += bit_width * rng.randrange(5, 40)
+    lines = np.ones((2, int(t + bit_width * 20)), dtype=np.uint16)
+    for start, rxtx, byte in events:
+        for k, bit in enumerate([0] + [(byte >> k) & 1 for k in range(8)] + [1]):
+            lines[rxtx, int(round(start + k * bit_width)):int(round(start + (k + 1) * bit_width))] = bit
+    return (lines[0] | lines[1] << 1).astype('<u2').tobytes()
+
+
+@pytest.mark.parametrize('restart', [False, True])
+def test_sample_dump(tmp_path, restart):
+    data = waveform(3)
+    path = str(tmp_path / 'bus.samples')
+    expected, full = append_and_update(path, data, [], False)
+    assert any(annotations for _, _, _, _, _, annotations in expected)
+    assert {frame[0] for frame in expected} == {0, 1}
+
+    # odd bounds split sample words
+    rng = random.Random(3)
+    frames, tail = append_and_update(path, data, random_bounds(rng, len(data)), restart)
+    assert frames == expected
+    assert tail.offset == len(data)
+    assert counters(tail) == counters(full)
+    assert tail.correlator.summary() == full.correlator.summary()
@@ -0,0 +1,29 @@
+from midea_serial.encoder import encode_ac_status, encode_frame
+from midea_serial.engine import ANN_STATE, FrameDecoder, RX
+from midea_serial.tracker import StateTracker
+
+
+def test_changes_only():
+    states = [{}, {}, dict(setpoint=26.0), dict(setpoint=26.0), dict(setpoint=26.0, fan_speed=40, horizontal_swing=True)]
+    data = b''.join(encode_frame(0x02, encode_ac_status(msg_id=msg_id, **state), msg_id=msg_id)
+                    for msg_id, state in enumerate(states))
+    frames = list(FrameDecoder().decode(data, RX))
+    assert len(frames) == len(states)
+
+    tracker = StateTracker()
+    annotations = [annotation for frame in frames for annotation in tracker.add(frame)] + tracker.flush()
+    assert [(ss, es, ann_class) for ss, es, ann_class, _ in annotations] == [
+        (frames[0].ss, frames[1].es, ANN_STATE + RX),
+        (frames[2].ss, frames[3].es, ANN_STATE + RX),
+        (frames[4].ss, frames[4].es, ANN_STATE + RX),
+    ]
+    first, second, third = [texts for _, _, _, texts in annotations]
+    # the first period has the whole state, nothing changed yet
+    assert first == ['on, mode=cool, setpoint=24.00, fanspeed=auto, horizontal swing=off, vertical swing=off, '
+                     'indoor T=25.0, outdoor T=30.0, error code=0', 'State']
+    # the next ones name only the fields that changed, msg id and CRC changes are ignored
+    assert second[1:] == ['setpoint changed', 'State']
+    assert second[0].endswith('setpoint=26.00, fanspeed=auto, horizontal swing=off, vertical swing=off, '
+                              'indoor T=25.0, outdoor T=30.0, error code=0 (setpoint changed)')
+    assert third[1:] == ['fan_speed, horizontal_swing changed', 'State']
+    assert tracker.changes == 2
@@ -0,0 +1,68 @@
+import random
+import pytest
+from midea_serial.encoder import encode_frame
+from midea_serial.engine import RX, TX
+
+np = pytest.importorskip('numpy')
+from midea_serial.uart import UartFrontEnd  # noqa: E402
+
+SAMPLERATE = 1000000
+BAUDRATE = 9600
+
+
+def waveform(seed=0):
+    # one frame per line, the TX bytes start while RX ones are being received
+    rng = random.Random(seed)
+    bit_width = SAMPLERATE / BAUDRATE
+    events = []  # (start bit edge, rxtx, byte)
+    for rxtx, start in ((RX, 500), (TX, 3000)):
+        t = start
+        for byte in encode_frame(0x41, bytes(rng.randrange(256) for _ in range(6)), msg_id=rxtx):
+            events.append((int(round(t)), rxtx, byte))
+            t += bit_width * (10 + rng.random())
+    lines = np.ones((2, int(t + bit_width * 20)), dtype=np.uint8)
+    for start, rxtx, byte in events:
+        for k, bit in enumerate([0] + [(byte >> k) & 1 for k in range(8)] + [1]):
+            lines[rxtx, int(round(start + k * bit_width)):int(round(start + (k + 1) * bit_width))] = bit
+    return (lines[RX] | lines[TX] << 1).astype(np.uint8), sorted(events)
+
+
+def decode_per_sample(samples):
+    # reference: walk the samples one by one like the uart PD does
+    uart = UartFrontEnd(SAMPLERATE, BAUDRATE)
+    centers = uart.centers.tolist()
+    packets = []
+    for rxtx in (RX, TX):
+        line = ((samples >> rxtx) & 1).tolist()
+        i = 1
+        while i + centers[-1] < len(line):
+            if line[i - 1] and not line[i] and not line[i + centers[0]]:
+                byte = sum(line[i + centers[1 + k]] << k for k in range(8))
+                packets.append((i + int(uart.bit_starts[1]), i + int(uart.bit_starts[9]), rxtx, byte))
+                i += centers[-1]
+            i += 1
+    return sorted(packets)
+
+
+def decode_chunks(samples, bounds):
+    uart = UartFrontEnd(SAMPLERATE, BAUDRATE)
+    chunks = [samples[start:end] for start, end in zip([0] + bounds, bounds + [len(samples)])]
+    return [(ss, es, rxtx, byte) for ss, es, (_, rxtx, (byte, _)) in uart.decode(chunks)]
+
+
+def test_chunk_sizes():
+    samples, events = waveform()
+    expected = decode_per_sample(samples)
+    assert [(rxtx, byte) for _, _, rxtx, byte in expected] == [(rxtx, byte) for _, rxtx, byte in events]
+
+    bit_width = SAMPLERATE / BAUDRATE
+    starts = [start for start, _, _ in events]
+    splits = {
+        'start bit': [start + int(bit_width / 2) for start in starts[::3]],
+        'start edge': [start + offset for start, offset in zip(starts[::3], (0, 1))],
+        'stop bit': [start + int(bit_width * 9.5) for start in starts[1::3]],
+    }
+    for size in (7, 100, 1000, 4096, len(samples)):
+        splits[size] = list(range(size, len(samples), size))
+    for name, bounds in splits.items():
+        assert decode_chunks(samples, sorted(set(bounds))) == expected, name
@@ -0,0 +1,77 @@
+import random
+import pytest
+from midea_serial import util
+from midea_serial.util import checksum, checksum_batch, crc8, crc8_854_table, crc8_batch
+
+
+def crc8_bitwise(data):
+    # CRC-8/MAXIM (reflected polynomial 0x8C) bit by bit, what crc8_854_table tabulates
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x8C if crc & 1 else crc >> 1
+    return crc
+
+
+def random_frames(seed, count=300):
+    rng = random.Random(seed)
+    frames = [bytes(rng.randrange(0x100) for _ in range(rng.choice((0, 1, 2, 10, rng.randrange(256)))))
+              for _ in range(count)]
+    # frames that validate, checksum or CRC8 appended
+    frames += [frame + bytes([checksum(frame)]) for frame in frames[:50]]
+    frames += [frame + bytes([crc8(frame)]) for frame in frames[:50]]
+    return frames
+
+
+@pytest.fixture(params=['numpy', 'fallback'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(util, '_numpy', lambda: None)
+    return request.param
+
+
+def test_crc8_table():
+    assert crc8_854_table == [crc8_bitwise([value]) for value in range(0x100)]
+    for frame in random_frames(1):
+        assert crc8(frame) == crc8_bitwise(frame)
+
+
+def test_checksum_batch(backend):
+    frames = random_frames(2)
+    values, valid = checksum_batch(frames)
+    assert [int(value) for value in values] == [checksum(frame) for frame in frames]
+    assert [bool(ok) for ok in valid] == [checksum(frame) == 0 for frame in frames]
+
+
+def test_crc8_batch(backend):
+    frames = random_frames(3)
+    values, valid = crc8_batch(frames)
+    assert [int(value) for value in values] == [crc8(frame) for frame in frames]
+    assert [bool(ok) for ok in valid] == [crc8(frame) == 0 for frame in frames]
+
+
+def test_crc8_batch_expected(backend):
+    frames = random_frames(4)
+    rng = random.Random(4)
+    expected = [crc8(frame) if rng.random() < 0.5 else rng.randrange(0x100) for frame in frames]
+    values, valid = crc8_batch(frames, expected)
+    assert [int(value) for value in values] == [crc8(frame) for frame in frames]
+    assert [bool(ok) for ok in valid] == [crc8(frame) == crc for frame, crc in zip(frames, expected)]
+
+
+def test_empty(backend):
+    for batch in (checksum_batch, crc8_batch):
+        values, valid = batch([])
+        assert len(values) == 0 and len(valid) == 0
+        values, valid = batch([b'', b''])
+        assert [int(value) for value in values] == [0, 0]
+        assert [bool(ok) for ok in valid] == [True, True]
+
+
+def test_pack_frames_requires_numpy(monkeypatch):
+    monkeypatch.setattr(util, '_numpy', lambda: None)
+    with pytest.raises(ImportError, match='NumPy'):
+        util.pack_frames([b'\x01'])